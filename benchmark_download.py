@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+
+#
+# * Copyright (c) 2009-2017. Authors: see NOTICE file.
+# *
+# * Licensed under the Apache License, Version 2.0 (the "License");
+# * you may not use this file except in compliance with the License.
+# * You may obtain a copy of the License at
+# *
+# *      http://www.apache.org/licenses/LICENSE-2.0
+# *
+# * Unless required by applicable law or agreed to in writing, software
+# * distributed under the License is distributed on an "AS IS" BASIS,
+# * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# * See the License for the specific language governing permissions and
+# * limitations under the License.
+# */
+
+
+__author__          = "Vanhee Laurent <laurent.vanhee@student.uliege.ac.be>"
+__copyright__       = "Copyright 2010-2017 University of Liège, Belgium, http://www.cytomine.be/"
+
+
+import csv
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import config
+import download_data
+from cytomine_standin import Standin_data, Standin_server
+
+
+def benchmark(workers_list, latency=0.05, error_rate=0.0, nb_images=5, nb_users=20, nb_positions=2000, stream=False,
+              skip_inactive=config.SKIP_INACTIVE_PAIRS):
+    """
+    Runs download_data.get_data against a local Cytomine stand-in for each number of workers
+    and prints the throughput of each run
+    :param workers_list: list of worker counts to benchmark
+    :param latency: average latency (s) of the stand-in
+    :param error_rate: fraction [0-1] of requests failing
+    :param nb_images: number of images of the synthetic project
+    :param nb_users: number of users of the synthetic project
+    :param nb_positions: average number of positions of an active (image, user) pair
+    :param stream: whether positions are streamed page by page
+    :param skip_inactive: whether only the pairs with image consultations in the time range are fetched
+    :return: list of (workers, seconds, pairs/s, bytes/s, requests)
+    """
+    data = Standin_data(nb_images=nb_images, nb_users=nb_users, nb_positions=nb_positions)
+    working_dir = tempfile.mkdtemp()
+    users_file = os.path.join(working_dir, "students.csv")
+    f = open(users_file, "wb")
+    csvout = csv.writer(f)
+    csvout.writerow(['M', 'M'])
+    csvout.writerow(['USERNAME', 'CYTOMINE ID'])
+    for u in data.users():
+        csvout.writerow([u['username'], u['id']])
+    f.close()
+
+    previous_working_dir = config.WORKING_DIRECTORY
+    config.WORKING_DIRECTORY = working_dir + "/"
+    ret = []
+    try:
+        for workers in workers_list:
+            server = Standin_server(0, data, latency=latency, error_rate=error_rate)
+            thread = threading.Thread(target=server.serve_forever)
+            thread.daemon = True
+            thread.start()
+
+            project_dir = "bench_%d/" % workers
+            start = time.time()
+            download_data.get_data(project_dir, data.id_project, users_file, data.id_ref_user,
+                                   cytomine_host="localhost:%d" % server.server_port, workers=workers, stream=stream,
+                                   skip_inactive=skip_inactive)
+            elapsed = time.time() - start
+
+            server.shutdown()
+            server.server_close()
+            nb_requests, nb_bytes, per_endpoint = server.stats()
+            if 'unknown' in per_endpoint:
+                print "%d requests to endpoints the stand-in does not serve" % per_endpoint['unknown'][0]
+            nb_pairs = nb_images * nb_users
+            ret.append((workers, elapsed, nb_pairs / elapsed, nb_bytes / elapsed, nb_requests))
+            shutil.rmtree(os.path.join(working_dir, project_dir))
+    finally:
+        config.WORKING_DIRECTORY = previous_working_dir
+        shutil.rmtree(working_dir)
+
+    print "%8s %10s %10s %12s %10s" % ("workers", "seconds", "pairs/s", "KB/s", "requests")
+    for workers, elapsed, pairs_s, bytes_s, nb_requests in ret:
+        print "%8d %10.2f %10.2f %12.1f %10d" % (workers, elapsed, pairs_s, bytes_s / 1024, nb_requests)
+    return ret
+
+
+def error_msg():
+    """
+    Output error msg
+    :return:
+    """
+    print "Format : benchmark_download.py <nb_workers> [<nb_workers> ...]"
+    print "Options :"
+    print "  -L <latency_ms> :\n    Average latency of the stand-in server, Default 50\n"
+    print "  -E <error_rate> :\n    Fraction of requests failing, Default 0\n"
+    print "  -I <nb_images> :\n    Number of images, Default 5\n"
+    print "  -U <nb_users> :\n    Number of users, Default 20\n"
+    print "  -P <nb_positions> :\n    Average number of positions of an active (image, user) pair, Default 2000\n"
+    print "  --stream :\n    Streams positions page by page\n"
+    print "  --all-pairs :\n    Fetches every (image, user) pair, Default only the pairs with image consultations in the time range\n"
+
+
+def handle_args(args):
+    workers_list = []
+    latency = 0.05
+    error_rate = 0.0
+    nb_images = 5
+    nb_users = 20
+    nb_positions = 2000
+    stream = False
+    skip_inactive = config.SKIP_INACTIVE_PAIRS
+    try:
+        i = 1
+        while i < len(args):
+            if args[i] == "-L" and (i + 1) < len(args):
+                latency = float(args[i + 1]) / 1000.0
+                i += 2
+            elif args[i] == "-E" and (i + 1) < len(args):
+                error_rate = float(args[i + 1])
+                i += 2
+            elif args[i] == "-I" and (i + 1) < len(args):
+                nb_images = int(args[i + 1])
+                i += 2
+            elif args[i] == "-U" and (i + 1) < len(args):
+                nb_users = int(args[i + 1])
+                i += 2
+            elif args[i] == "-P" and (i + 1) < len(args):
+                nb_positions = int(args[i + 1])
+                i += 2
+            elif args[i] == "--stream":
+                stream = True
+                i += 1
+            elif args[i] == "--all-pairs":
+                skip_inactive = False
+                i += 1
+            else:
+                workers_list.append(int(args[i]))
+                i += 1
+    except:
+        error_msg()
+        return
+    if len(workers_list) == 0:
+        error_msg()
+        return
+
+    benchmark(workers_list, latency=latency, error_rate=error_rate, nb_images=nb_images, nb_users=nb_users,
+              nb_positions=nb_positions, stream=stream, skip_inactive=skip_inactive)
+
+
+if __name__ == '__main__':
+
+    handle_args(sys.argv)
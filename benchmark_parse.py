@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+
+#
+# * Copyright (c) 2009-2017. Authors: see NOTICE file.
+# *
+# * Licensed under the Apache License, Version 2.0 (the "License");
+# * you may not use this file except in compliance with the License.
+# * You may obtain a copy of the License at
+# *
+# *      http://www.apache.org/licenses/LICENSE-2.0
+# *
+# * Unless required by applicable law or agreed to in writing, software
+# * distributed under the License is distributed on an "AS IS" BASIS,
+# * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# * See the License for the specific language governing permissions and
+# * limitations under the License.
+# */
+
+
+__author__          = "Vanhee Laurent <laurent.vanhee@student.uliege.ac.be>"
+__copyright__       = "Copyright 2010-2017 University of Liège, Belgium, http://www.cytomine.be/"
+
+import csv
+import sys
+import time
+import numpy as np
+from dictionary_data import parse_positions, parse_positions_literal
+
+
+class Gaussians_holder:
+    """
+    Stands for the Image_data object the parsers store the gaussians in
+    """
+    def __init__(self):
+        self.gaussians = dict(('zoom_%d' % z, None) for z in range(4, 11))
+
+
+def synthetic_rows(nb_positions, seed=0):
+    """
+    Rows of a positions csv file, as written by download_data.py
+    :param nb_positions: number of rows
+    :param seed: random seed
+    :return: list of rows (corners, center, zoom, created)
+    """
+    rng = np.random.RandomState(seed)
+    rows = []
+    timestamp = 1486193568061.0
+    for i in range(nb_positions):
+        zoom = rng.randint(1, 10)
+        half_w = round(512.0 / 2 ** (zoom - 1)) + 1
+        half_h = round(256.0 / 2 ** (zoom - 1)) + 1
+        x = round(rng.uniform(0, 1024))
+        y = round(rng.uniform(0, 1024))
+        corners = [(x - half_w, y - half_h), (x + half_w, y - half_h), (x + half_w, y + half_h), (x - half_w, y + half_h)]
+        timestamp += rng.randint(100, 5000)
+        rows.append([str(corners), str((x, y)), str(zoom), str(timestamp)])
+    return rows
+
+
+def read_rows(filename):
+    """
+    :param filename: <user>_cytomine_positions.csv file
+    :return: rows without header
+    """
+    f = open(filename, 'rb')
+    csv_in = csv.reader(f)
+    data = list(csv_in)
+    f.close()
+    data.pop(0)
+    return data
+
+
+def same_positions(a, b):
+    """
+    :return: whether 2 dictionaries of positions hold the same values (parse_positions uses smaller dtypes)
+    """
+    for key in ['x', 'y', 'dur', 'timestamp', 'zoom']:
+        if not np.array_equal(a[key], b[key]):
+            return False
+    return np.array_equal(np.reshape(a['corners'], (-1, 4, 2)), np.reshape(b['corners'], (-1, 4, 2)))
+
+
+def benchmark(rows, repeat=3, end_date=None):
+    """
+    Times parse_positions (bulk) against parse_positions_literal (row by row) on the same rows,
+    and checks that they give the same positions and gaussians
+    :param rows: csv rows without header
+    :param repeat: number of runs of each parser, the best one is kept
+    :param end_date: optional, remove positions after this date
+    :return: (seconds literal, seconds bulk)
+    """
+    ret = {}
+    for name, parser in [("literal", parse_positions_literal), ("bulk", parse_positions)]:
+        best = None
+        for i in range(repeat):
+            holder = Gaussians_holder()
+            data = [list(row) for row in rows]
+            start = time.time()
+            positions = parser(data, holder, calc_gauss=True, end_date=end_date)
+            elapsed = time.time() - start
+            best = elapsed if best is None else min(best, elapsed)
+        ret[name] = (best, positions, holder.gaussians)
+
+    same = same_positions(ret['literal'][1], ret['bulk'][1])
+    for zoom in ret['literal'][2]:
+        g_literal = ret['literal'][2][zoom]
+        g_bulk = ret['bulk'][2][zoom]
+        if (g_literal is None) != (g_bulk is None) or \
+                (g_literal is not None and (g_literal[1:] != g_bulk[1:] or not np.array_equal(g_literal[0], g_bulk[0]))):
+            same = False
+
+    print "%d positions" % len(rows)
+    print "%10s %10s %14s" % ("parser", "seconds", "positions/s")
+    for name in ["literal", "bulk"]:
+        print "%10s %10.4f %14.0f" % (name, ret[name][0], len(rows) / max(ret[name][0], 1e-9))
+    print "speedup x%.1f, same result : %s" % (ret['literal'][0] / max(ret['bulk'][0], 1e-9), same)
+    return ret['literal'][0], ret['bulk'][0]
+
+
+def error_msg():
+    """
+    Output error msg
+    :return:
+    """
+    print "Format : benchmark_parse.py [<positions_csv_file>]"
+    print "  Default synthetic positions"
+    print "Options :"
+    print "  -P <nb_positions> :\n    Number of synthetic positions, Default 20000\n"
+    print "  -R <repeat> :\n    Runs of each parser, the best one is kept, Default 3\n"
+
+
+def handle_args(args):
+    filename = None
+    nb_positions = 20000
+    repeat = 3
+    try:
+        i = 1
+        while i < len(args):
+            if args[i] == "-P" and (i + 1) < len(args):
+                nb_positions = int(args[i + 1])
+                i += 2
+            elif args[i] == "-R" and (i + 1) < len(args):
+                repeat = int(args[i + 1])
+                i += 2
+            elif filename is None and not args[i].startswith("-"):
+                filename = str(args[i])
+                i += 1
+            else:
+                raise ValueError(args[i])
+    except:
+        error_msg()
+        return
+
+    if filename is not None:
+        rows = read_rows(filename)
+    else:
+        rows = synthetic_rows(nb_positions)
+    benchmark(rows, repeat=repeat)
+
+
+if __name__ == '__main__':
+
+    handle_args(sys.argv)
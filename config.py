@@ -28,6 +28,28 @@ ML_LEARNING_RATIO = 0.7
 CLUSTER_SIZE = 20
 REDUCE_WEIGHT = 0.95
 AFK_TIME = 300000
+DOWNLOAD_WORKERS = 8
+RETRY_MAX_ATTEMPTS = 8
+RETRY_BASE_DELAY = 0.5
+RETRY_MAX_DELAY = 30
+BREAKER_WINDOW = 50
+BREAKER_ERROR_RATE = 0.5
+BREAKER_PAUSE = 30
+STREAM_POSITIONS = False
+TELEMETRY_INTERVAL = 60
+PARSE_WORKERS = 2
+PIPELINE_QUEUE_SIZE = 64
+MANIFEST_SYNC_EVERY = 100
+PLAN_SAMPLE_PAIRS = 5
+SKIP_INACTIVE_PAIRS = True
+ACTIVITY_MARGIN = 86400000
+RATE_LIMIT_MAX_RATE = 50
+RATE_LIMIT_MAX_CONCURRENCY = 16
+RATE_LIMIT_TARGET_LATENCY = 2
+IMAGE_STORE = False
+MEMORY_MAP_POSITIONS = False
+GAUSSIAN_CACHE_SIZE = 64
+IMAGE_DATA_MAX_USERS = None
 cytomine_host="localhost-core"
 cytomine_public_key="XXX-XXX-XXX-XXX-XXX" ##to edit
 cytomine_private_key="XXX-XXX-XXX-XXX-XXX" ##to edit
@@ -0,0 +1,409 @@
+# -*- coding: utf-8 -*-
+
+#
+# * Copyright (c) 2009-2017. Authors: see NOTICE file.
+# *
+# * Licensed under the Apache License, Version 2.0 (the "License");
+# * you may not use this file except in compliance with the License.
+# * You may obtain a copy of the License at
+# *
+# *      http://www.apache.org/licenses/LICENSE-2.0
+# *
+# * Unless required by applicable law or agreed to in writing, software
+# * distributed under the License is distributed on an "AS IS" BASIS,
+# * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# * See the License for the specific language governing permissions and
+# * limitations under the License.
+# */
+
+
+__author__          = "Vanhee Laurent <laurent.vanhee@student.uliege.ac.be>"
+__copyright__       = "Copyright 2010-2017 University of Liège, Belgium, http://www.cytomine.be/"
+
+
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import urlparse
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+from StringIO import StringIO
+from PIL import Image
+
+
+class Standin_data:
+    """
+    Synthetic Cytomine project served by the stand-in server. Everything is generated from the seed,
+    so two runs with the same settings serve exactly the same data.
+    """
+    def __init__(self, id_project=1197608, id_ref_user=1590, nb_images=10, nb_users=20, nb_positions=2000,
+                 nb_ref_annotations=10, inactive=0.5, start_timestamp=1486000000000, end_timestamp=1504000000000,
+                 seed=0):
+        """
+        Inits the object
+        :param id_project: project id
+        :param id_ref_user: user id of the reference annotations
+        :param nb_images: number of images in the project
+        :param nb_users: number of users in the project
+        :param nb_positions: average number of positions of an active (image, user) pair
+        :param nb_ref_annotations: number of reference annotations per image
+        :param inactive: fraction [0-1] of (image, user) pairs without any data
+        :param start_timestamp: first position timestamp
+        :param end_timestamp: last position timestamp
+        :param seed: random seed
+        """
+        self.id_project = id_project
+        self.id_ref_user = id_ref_user
+        self.nb_positions = nb_positions
+        self.nb_ref_annotations = nb_ref_annotations
+        self.inactive = inactive
+        self.start_timestamp = start_timestamp
+        self.end_timestamp = end_timestamp
+        self.seed = seed
+        self.image_ids = [10000 + i for i in range(nb_images)]
+        self.user_ids = [20000 + i for i in range(nb_users)]
+        self.width = 40000
+        self.height = 30000
+        self.depth = 10
+        self.positions = {}
+        self.lock = threading.Lock()
+
+    def users(self):
+        return [{'id': u, 'username': "student%d" % u, 'email': "student%d@uliege.be" % u,
+                 'firstname': "S", 'lastname': str(u)} for u in self.user_ids]
+
+    def image(self, id_image):
+        return {'id': id_image, 'project': self.id_project, 'baseImage': id_image, 'width': self.width,
+                'height': self.height, 'depth': self.depth, 'numberOfAnnotations': self.nb_ref_annotations,
+                'preview': "/api/abstractimage/%d/thumb.png?maxSize=256" % id_image,
+                'thumb': "/api/abstractimage/%d/thumb.png?maxSize=256" % id_image}
+
+    def is_active(self, id_image, id_user):
+        return random.Random(hash((self.seed, id_image, id_user))).random() >= self.inactive
+
+    def user_positions(self, id_image, id_user):
+        """
+        All the positions of a pair, sorted by date (cached since positions are served page by page)
+        """
+        key = (id_image, id_user)
+        with self.lock:
+            if key in self.positions:
+                return self.positions[key]
+        ret = []
+        if self.is_active(id_image, id_user):
+            rnd = random.Random(hash((self.seed, id_image, id_user, 'positions')))
+            n = int(rnd.expovariate(1.0 / self.nb_positions))
+            created = rnd.randint(self.start_timestamp, self.end_timestamp)
+            for i in range(n):
+                created += rnd.randint(200, 20000)
+                zoom = rnd.randint(1, self.depth)
+                if rnd.random() < 0.05:
+                    # image opened, viewport centered on the image
+                    x, y = self.width / 2, self.height / 2
+                else:
+                    x, y = rnd.randint(0, self.width), rnd.randint(0, self.height)
+                w = self.width / (2 ** (zoom - 1))
+                h = self.height / (2 ** (zoom - 1))
+                location = "POLYGON ((%d %d, %d %d, %d %d, %d %d, %d %d))" % (x - w / 2, y - h / 2, x + w / 2, y - h / 2,
+                                                                          x + w / 2, y + h / 2, x - w / 2, y + h / 2,
+                                                                          x - w / 2, y - h / 2)
+                ret.append({'id': i, 'user': id_user, 'image': id_image, 'x': x, 'y': y, 'zoom': zoom,
+                            'created': str(created), 'updated': None, 'location': location})
+        with self.lock:
+            self.positions[key] = ret
+        return ret
+
+    def consultations(self, id_user):
+        """
+        Image consultations of a user : one per active image, when the user starts browsing it
+        """
+        ret = []
+        for id_image in self.image_ids:
+            if self.is_active(id_image, id_user):
+                positions = self.user_positions(id_image, id_user)
+                if len(positions) > 0:
+                    created = positions[0]['created']
+                else:
+                    created = str(random.Random(hash((self.seed, id_image, id_user, 'consultations'))).randint(
+                        self.start_timestamp, self.end_timestamp))
+                ret.append({'id': id_image * 100000 + id_user, 'user': id_user, 'image': id_image,
+                            'project': self.id_project, 'created': created, 'mode': 'Explore'})
+        return ret
+
+    def annotations(self, id_image, id_user):
+        if id_user == self.id_ref_user:
+            n = self.nb_ref_annotations
+        elif self.is_active(id_image, id_user):
+            n = random.Random(hash((self.seed, id_image, id_user, 'annotations'))).randint(0, 2)
+        else:
+            n = 0
+        rnd = random.Random(hash((self.seed, id_image, id_user, 'annotations')))
+        ret = []
+        for i in range(n):
+            created = str(rnd.randint(self.start_timestamp, self.end_timestamp))
+            ret.append({'id': self.annotation_id(id_image, id_user, i), 'user': id_user, 'image': id_image,
+                        'project': self.id_project, 'created': created, 'updated': created,
+                        'location': "POINT (%d %d)" % (rnd.randint(0, self.width), rnd.randint(0, self.height))})
+        return ret
+
+    def annotation_id(self, id_image, id_user, i):
+        return (id_image * 100000 + id_user) * 100 + i
+
+    def properties(self, id_annotation):
+        return [{'id': id_annotation, 'domainIdent': id_annotation, 'key': 'n', 'value': str(id_annotation % 100 + 1)}]
+
+    def actions(self, id_image, id_user):
+        positions = self.user_positions(id_image, id_user)
+        if len(positions) == 0:
+            return []
+        rnd = random.Random(hash((self.seed, id_image, id_user, 'actions')))
+        ret = []
+        for i in range(rnd.randint(0, self.nb_ref_annotations)):
+            p = positions[rnd.randint(0, len(positions) - 1)]
+            ident = self.annotation_id(id_image, self.id_ref_user, rnd.randint(0, max(0, self.nb_ref_annotations - 1)))
+            ret.append({'id': i, 'user': id_user, 'image': id_image, 'created': str(int(p['created']) + 100),
+                        'annotationIdent': ident if rnd.random() < 0.7 else None, 'action': 'select'})
+        ret.sort(key=lambda a: int(a['created']))
+        return ret
+
+
+class Standin_handler(BaseHTTPRequestHandler):
+    """
+    Serves the Cytomine endpoints used by download_data, from the fixtures directory if a recorded
+    response exists, from the synthetic data otherwise
+    """
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        url = urlparse.urlparse(self.path)
+        params = dict((k.lower(), v[-1]) for k, v in urlparse.parse_qs(url.query).items())
+        endpoint, body, content_type = self.route(url.path, params)
+
+        if server.latency > 0:
+            time.sleep(random.uniform(0.5, 1.5) * server.latency)
+        if body is not None and random.random() < server.error_rate:
+            endpoint = 'error'
+            status, body, content_type = 503, '{"message": "Injected error"}', "application/json"
+        elif body is None:
+            status, body, content_type = 404, '{"message": "Not found"}', "application/json"
+        else:
+            status = 200
+
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        server.count(endpoint, len(body))
+
+    def route(self, path, params):
+        """
+        Finds the response of a request
+        :param path: url path
+        :param params: query parameters (lower case keys)
+        :return: (endpoint name, body or None if unknown, content type)
+        """
+        server = self.server
+        data = server.data
+
+        fixture = server.fixture(path, params)
+        if fixture is not None:
+            return 'fixture', fixture, "application/json"
+
+        m = re.search(r"abstractimage/(\d+)/thumb\.png$", path)
+        if m:
+            return 'thumb', server.thumbnail(int(params.get('maxsize', 256))), "image/png"
+        m = re.search(r"project/(\d+)/user/(\d+)/imageconsultation\.json$", path)
+        if m:
+            return 'image_consultations', collection(data.consultations(int(m.group(2)))), "application/json"
+        m = re.search(r"project/(\d+)/user\.json$", path)
+        if m:
+            return 'project_users', collection(data.users()), "application/json"
+        m = re.search(r"project/(\d+)/imageinstance\.json$", path)
+        if m:
+            return 'image_instances', collection([data.image(i) for i in data.image_ids]), "application/json"
+        m = re.search(r"imageinstance/(\d+)\.json$", path)
+        if m:
+            return 'image_instance', json.dumps(data.image(int(m.group(1)))), "application/json"
+        m = re.search(r"imageinstance/(\d+)/positions\.json$", path)
+        if m:
+            positions = data.user_positions(int(m.group(1)), int(params.get('user', 0)))
+            positions = [p for p in positions if after_before(p, params)]
+            return 'positions', page(positions, params), "application/json"
+        m = re.search(r"(?:annotation|domain/[\w.]+)/(\d+)/property\.json$", path)
+        if m:
+            return 'annotation_properties', collection(data.properties(int(m.group(1)))), "application/json"
+        m = re.search(r"annotationaction\.json$|imageinstance/(\d+)/annotationactions\.json$", path)
+        if m:
+            id_image = int(m.group(1) or params.get('image', 0))
+            actions = [a for a in data.actions(id_image, int(params.get('user', 0))) if after_before(a, params)]
+            return 'annotation_actions', page(actions, params), "application/json"
+        m = re.search(r"annotation\.json$", path)
+        if m:
+            annotations = data.annotations(int(params.get('image', 0)), int(params.get('user', 0)))
+            return 'annotations', collection(annotations), "application/json"
+        return 'unknown', None, "application/json"
+
+
+class Standin_server(ThreadingMixIn, HTTPServer):
+    """
+    Local stand-in for a Cytomine core, with configurable latency, error injection and volume
+    """
+    daemon_threads = True
+
+    def __init__(self, port, data, latency=0.0, error_rate=0.0, fixtures_dir=None):
+        """
+        Inits the server (call serve_forever to start it)
+        :param port: port to listen on (0 picks a free one, see server_port)
+        :param data: Standin_data object
+        :param latency: average latency (s) added to each request
+        :param error_rate: fraction [0-1] of requests answered with a 503 error
+        :param fixtures_dir: optional, directory of recorded json responses
+        """
+        HTTPServer.__init__(self, ('localhost', port), Standin_handler)
+        self.data = data
+        self.latency = latency
+        self.error_rate = error_rate
+        self.fixtures_dir = fixtures_dir
+        self.thumbnails = {}
+        self.requests = {}
+        self.bytes = {}
+        self.lock = threading.Lock()
+
+    def count(self, endpoint, nb_bytes):
+        with self.lock:
+            self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+            self.bytes[endpoint] = self.bytes.get(endpoint, 0) + nb_bytes
+
+    def fixture(self, path, params):
+        """
+        Recorded response of a request : <fixtures_dir>/<path with / replaced by _>[_<sorted query>].json,
+        EG api_project_1197608_user.json or api_imageinstance_42_positions.json_max=500_offset=0_user=7.json
+        :return: file content, None if there is no fixture for this request
+        """
+        if self.fixtures_dir is None:
+            return None
+        name = path.strip('/').replace('/', '_')
+        query = "_".join(k + "=" + params[k] for k in sorted(params))
+        candidates = [name]
+        if query:
+            candidates.insert(0, name + "_" + query + ".json")
+        for filename in candidates:
+            filename = os.path.join(self.fixtures_dir, filename)
+            if os.path.isfile(filename):
+                f = open(filename, "rb")
+                body = f.read()
+                f.close()
+                return body
+        return None
+
+    def thumbnail(self, max_size):
+        with self.lock:
+            if max_size not in self.thumbnails:
+                im = Image.new('RGB', (max_size, max_size * self.data.height / self.data.width), (230, 200, 220))
+                out = StringIO()
+                im.save(out, 'PNG')
+                self.thumbnails[max_size] = out.getvalue()
+            return self.thumbnails[max_size]
+
+    def stats(self):
+        """
+        :return: (total number of requests, total bytes sent, {endpoint: (requests, bytes)})
+        """
+        with self.lock:
+            per_endpoint = dict((e, (self.requests[e], self.bytes[e])) for e in self.requests)
+        return sum(r for r, b in per_endpoint.values()), sum(b for r, b in per_endpoint.values()), per_endpoint
+
+
+def after_before(obj, params):
+    """
+    Whether an object is in the afterThan/beforeThan time range of a request
+    """
+    created = int(obj['created'])
+    if 'afterthan' in params and created < long(params['afterthan']):
+        return False
+    if 'beforethan' in params and created > long(params['beforethan']):
+        return False
+    return True
+
+
+def collection(objects):
+    return json.dumps({'collection': objects, 'size': len(objects), 'offset': 0, 'perPage': len(objects)})
+
+
+def page(objects, params):
+    """
+    Paging with the max/offset query parameters (everything if max is missing or 0)
+    """
+    offset = int(params.get('offset', 0))
+    max_size = int(params.get('max', 0))
+    if max_size > 0:
+        selected = objects[offset:offset + max_size]
+    else:
+        selected = objects[offset:]
+    return json.dumps({'collection': selected, 'size': len(objects), 'offset': offset, 'perPage': max_size})
+
+
+def error_msg():
+    """
+    Output error msg
+    :return:
+    """
+    print "Format : cytomine_standin.py <port>"
+    print "Options :"
+    print "  -L <latency_ms> :\n    Average latency added to each request, Default 0\n"
+    print "  -E <error_rate> :\n    Fraction of requests answered with a 503 error, Default 0\n"
+    print "  -I <nb_images> :\n    Number of images in the project, Default 10\n"
+    print "  -U <nb_users> :\n    Number of users in the project, Default 20\n"
+    print "  -P <nb_positions> :\n    Average number of positions of an active (image, user) pair, Default 2000\n"
+    print "  -F <fixtures_dir> :\n    Directory with recorded json responses, served instead of the synthetic data\n"
+
+
+def handle_args(args):
+    latency = 0.0
+    error_rate = 0.0
+    nb_images = 10
+    nb_users = 20
+    nb_positions = 2000
+    fixtures_dir = None
+    try:
+        port = int(args[1])
+        i = 2
+        while i < len(args):
+            if args[i] == "-L" and (i + 1) < len(args):
+                latency = float(args[i + 1]) / 1000.0
+            elif args[i] == "-E" and (i + 1) < len(args):
+                error_rate = float(args[i + 1])
+            elif args[i] == "-I" and (i + 1) < len(args):
+                nb_images = int(args[i + 1])
+            elif args[i] == "-U" and (i + 1) < len(args):
+                nb_users = int(args[i + 1])
+            elif args[i] == "-P" and (i + 1) < len(args):
+                nb_positions = int(args[i + 1])
+            elif args[i] == "-F" and (i + 1) < len(args):
+                fixtures_dir = str(args[i + 1])
+            else:
+                raise ValueError(args[i])
+            i += 2
+    except:
+        error_msg()
+        return
+
+    data = Standin_data(nb_images=nb_images, nb_users=nb_users, nb_positions=nb_positions)
+    server = Standin_server(port, data, latency=latency, error_rate=error_rate, fixtures_dir=fixtures_dir)
+    print "Cytomine stand-in listening on localhost:%d (project %d, reference user %d)" % (
+        server.server_port, data.id_project, data.id_ref_user)
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+
+    handle_args(sys.argv)
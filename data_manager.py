@@ -68,7 +68,8 @@ class Data_manager:
     """
     Data Manager class, manages user and image data.
     """
-    def __init__(self, project_name, image_list=None, user_dir="/users.csv", user_list=None, ml_out_dir=None):
+    def __init__(self, project_name, image_list=None, user_dir="/users.csv", user_list=None, ml_out_dir=None,
+                 memory_map=config.MEMORY_MAP_POSITIONS):
         """
         Inits the object
         :param project_name: project name (EG "gold")
@@ -76,6 +77,7 @@ class Data_manager:
         :param user_dir: Optional (preset), Directory of user metadata. This file contains data for
                 each user including name, grades, and etc...
         :param user_id: Optional, preset a user ID to only do operations on that user
+        :param memory_map: Optional, positions are mapped from the image stores instead of loaded to memory
         """
 
         # init vars
@@ -97,7 +99,7 @@ class Data_manager:
         for image in images:
             id = image.split('_')[1]
             if image.startswith("image") and (image_list is None or id in image_list):
-                self.image_list.append(image_data.Image_data(project_name, image, self, user_list))
+                self.image_list.append(image_data.Image_data(project_name, image, self, user_list, memory_map=memory_map))
                 self.nb_images += 1
                 bar.next()
         bar.finish()
@@ -1118,6 +1120,7 @@ def error_msg():
     print "  -S :\n    Generates the scanpaths for all the user/image pairs\n"
     print "  -T :\n    Generates the timelines for all the users\n"
     print "  -R :\n    Generates the raw point visualisations for all the user/image pairs\n"
+    print "  --mmap :\n    Maps the positions of the image stores in memory instead of loading them (see image_store.py)\n    Pages are read on demand and shared between processes\n"
 
 def handle_args(args):
     """
@@ -1136,6 +1139,7 @@ def handle_args(args):
     timlines = False
     ml_out_dir = None
     heatmaps = False
+    memory_map = config.MEMORY_MAP_POSITIONS
     project_name = args[1]
     if not os.path.exists(config.WORKING_DIRECTORY + project_name):
         error_msg()
@@ -1176,6 +1180,9 @@ def handle_args(args):
         elif args[i] == "-R":
             raw = True
             i += 1
+        elif args[i] == "--mmap":
+            memory_map = True
+            i += 1
         else:
             error_msg()
             return
@@ -1205,7 +1212,8 @@ def handle_args(args):
         user_list = [user_info]
 
 
-    manager = Data_manager(project_name, ml_out_dir=ml_out_dir, image_list=image_list, user_list=user_list)
+    manager = Data_manager(project_name, ml_out_dir=ml_out_dir, image_list=image_list, user_list=user_list,
+                           memory_map=memory_map)
     print manager
 
     if ml:
@@ -25,22 +25,24 @@ from ast import literal_eval
 import numpy as np
 from pygazeanalyser.gazeplotter import gaussian
 import config
+from image_store import parse_position_columns, compact_array
+from lru_cache import Lru_cache
+
+
+# gaussian kernels shared by all the images of the process, keyed by (width, sx, height, sy)
+gaussian_kernels = Lru_cache(config.GAUSSIAN_CACHE_SIZE)
 
 
 def get_dimensions(corners):
     """
-    Gets the dimension of a position based on the 4 corners of a position
-    :param corners: list with 4 elements containg pairs of xy coordinates
-    :return: (x_length, y_length)
+    Gets the dimension of a position based on the 4 corners of a position : the largest distance from the
+    first corner to the others, on each axis. Works on the corners of several positions at once.
+    :param corners: 4 pairs of xy coordinates (4, 2), or array of corners of n positions (n, 4, 2)
+    :return: (x_length, y_length), arrays of n lengths for n positions
     """
-    x0, y0 = corners[0]
-    x1, y1 = corners[1]
-    x2, y2 = corners[2]
-    x3, y3 = corners[3]
-
-    x = max([abs(x0 - x1), abs(x0 - x2), abs(x0 - x3)])
-    y = max([abs(y0 - y1), abs(y0 - y2), abs(y0 - y3)])
-    return x, y
+    corners = np.asarray(corners, dtype=np.double)
+    lengths = np.max(np.abs(corners[..., 1:, :] - corners[..., :1, :]), axis=-2)
+    return lengths.T[0], lengths.T[1]
 
 
 def get_nearest_annotation(timestamp, positions, annotations):
@@ -89,6 +91,45 @@ def get_nearest_annotation(timestamp, positions, annotations):
     return ann_id
 
 
+def get_nearest_annotations(timestamps, positions, annotations):
+    """
+    Same guess as get_nearest_annotation, for several AnnotationActions at once : the closest position of
+    each timestamp comes from a binary search, then the closest annotation of every position is found in
+    a single (timestamps x annotations) distance matrix
+    :param timestamps: array of timestamps of AnnotationActions
+    :param positions: position of all the users in the image
+    :param annotations: list of annotations in the image
+    :return: list of annotation ids (0 if still unknown, None if there is no annotation)
+    """
+    timestamps = np.asarray(timestamps, dtype=np.double)
+    position_timestamps = positions['timestamp']
+    n = len(position_timestamps)
+    if len(timestamps) == 0:
+        return []
+    if n == 0:
+        return [0] * len(timestamps)
+
+    # first position at or after each timestamp (the running maximum is sorted, and first reaches a
+    # timestamp at the same index as the positions themselves), then keep the previous one if it is closer
+    after = np.searchsorted(np.maximum.accumulate(position_timestamps), timestamps, side='left')
+    index = np.minimum(after, n - 1)
+    inside = (after > 0) & (after < n)
+    prev = position_timestamps[np.maximum(after - 1, 0)]
+    closer = dist(prev, timestamps) < dist(position_timestamps[index], timestamps)
+    index[inside & closer] -= 1
+
+    if len(annotations['id']) == 0:
+        return [None] * len(timestamps)
+
+    # x, y coordinates of closest positions against every annotation, the first closest annotation wins
+    x = positions['x'][index].astype(np.double)[:, np.newaxis]
+    y = positions['y'][index].astype(np.double)[:, np.newaxis]
+    x_annot = np.asarray(annotations['x'], dtype=np.double)[np.newaxis, :]
+    y_annot = np.asarray(annotations['y'], dtype=np.double)[np.newaxis, :]
+    distances = np.sqrt((dist(x, x_annot) ** 2) + (dist(y, y_annot) ** 2))
+    return [annotations['id'][i] for i in np.argmin(distances, axis=1)]
+
+
 def dist(a, b):
     """
     distance between 2 values
@@ -99,13 +140,64 @@ def dist(a, b):
     return np.abs(b - a)
 
 
-def parse_positions(data, image_data, duration=20, calc_gauss=True, end_date=None):
+def time_mask(timestamps, start_date=None, end_date=None):
+    """
+    Selects the timestamps within a time range, in a single pass
+    :param timestamps: array of timestamps
+    :param start_date: remove the timestamps before this date (None to keep them)
+    :param end_date: remove the timestamps after this date (None to keep them)
+    :return: boolean array, True for the timestamps to keep
+    """
+    keep = np.ones(len(timestamps), dtype=bool)
+    if start_date:
+        keep &= timestamps >= start_date
+    if end_date:
+        keep &= timestamps <= end_date
+    return keep
+
+
+def filter_rows(data, column, start_date=None, end_date=None):
     """
-    parse positions of a user in an image to a dictionary based on data read from file
+    Keeps the rows of a file within a time range, with a mask on the timestamp column instead of deleting
+    the rows one by one
+    :param data: data directly read from file
+    :param column: index of the timestamp column
+    :param start_date: remove the rows before this date (None to keep them)
+    :param end_date: remove the rows after this date (None to keep them)
+    :return: list of the rows kept
+    """
+    if not start_date and not end_date:
+        return data
+    timestamps = np.array([np.double(row[column]) for row in data], dtype=np.double)
+    keep = time_mask(timestamps, start_date, end_date)
+    return [data[i] for i in np.flatnonzero(keep)]
+
+
+def parse_positions(data, image_data, duration=20, calc_gauss=True, start_date=None, end_date=None):
+    """
+    parse positions of a user in an image to a dictionary based on data read from file. The columns are parsed
+    in bulk (see image_store.parse_position_columns), the result is the same as parse_positions_literal
+    :param data: data directly read from position file
+    :param image_data: ImageData object to store eventual gaussians
+    :param duration: base duration for each position (updated later)
+    :param calc_gauss: Whether or not gaussians are calculated for zoom levels
+    :param start_date: remove positions before this date
+    :param end_date: remove positions after this date
+    :return: dictionary of positions
+    """
+    return positions_from_columns(parse_position_columns(data), image_data, duration=duration, calc_gauss=calc_gauss,
+                                  start_date=start_date, end_date=end_date)
+
+
+def parse_positions_literal(data, image_data, duration=20, calc_gauss=True, start_date=None, end_date=None):
+    """
+    Row by row version of parse_positions, one literal_eval per corners and center.
+    Kept as the reference of benchmark_parse.py
     :param data: data directly read from position file
     :param image_data: ImageData object to store eventual gaussians
     :param duration: base duration for each position (updated later)
     :param calc_gauss: Whether or not gaussians are calculated for zoom levels
+    :param start_date: remove positions before this date
     :param end_date: remove positions after this date
     :return: dictionary of positions
     """
@@ -135,15 +227,7 @@ def parse_positions(data, image_data, duration=20, calc_gauss=True, end_date=Non
             i += 1
             time_fixed = 0.0
     """
-    if end_date:
-        i = 0
-        while i < len(data):
-            row_data = data[i]
-            timestamp = np.double(row_data[3])
-            if timestamp > end_date:
-                del data[i]
-            else:
-                i +=1
+    data = filter_rows(data, 3, start_date, end_date)
 
     # dict template
     ret = {'x': np.zeros(len(data)),
@@ -151,8 +235,7 @@ def parse_positions(data, image_data, duration=20, calc_gauss=True, end_date=Non
            'dur': np.zeros(len(data)),
            'timestamp': np.zeros(len(data), dtype=np.double),
            'zoom': np.zeros(len(data), dtype=np.int64),
-           'corners': [],
-           'heatmap': None}
+           'corners': []}
 
     # fills dictionary
     for row in range(len(data)):
@@ -168,33 +251,110 @@ def parse_positions(data, image_data, duration=20, calc_gauss=True, end_date=Non
 
         # calculate gaussian if needed
         if calc_gauss and ret['zoom'][row] > 3:
-            if image_data.gaussians['zoom_' + str(row_data[2])] is None:
-                x_l, y_l = get_dimensions(corners)
-                zoom_x = max(1, x_l)
-                zoom_y = max(1, y_l)
-                sx = zoom_x / 6
-                sy = zoom_y / 6
-                d = (gaussian(np.int(zoom_x), sx, np.int(zoom_y), sy), zoom_x, zoom_y)
-                image_data.gaussians['zoom_' + str(row_data[2])] = d
+            set_gaussian(image_data, row_data[2], corners)
     return ret
 
 
-def parse_annotations(data, end_date=None):
+def set_gaussian(image_data, zoom, corners):
+    """
+    Calculates the gaussian of a zoom level from the corners of a position, unless the image already has it
+    :param image_data: ImageData object to store the gaussian
+    :param zoom: zoom level
+    :param corners: corners of a position at this zoom level
+    :return: None
+    """
+    if image_data.gaussians['zoom_' + str(zoom)] is None:
+        x_l, y_l = get_dimensions(corners)
+        zoom_x = max(1, x_l)
+        zoom_y = max(1, y_l)
+        sx = zoom_x / 6
+        sy = zoom_y / 6
+        d = (get_gaussian(np.int(zoom_x), sx, np.int(zoom_y), sy), zoom_x, zoom_y)
+        image_data.gaussians['zoom_' + str(zoom)] = d
+
+
+def get_gaussian(width, sx, height, sy):
+    """
+    Gaussian kernel from the cache shared by all the images (the viewports have the same size at a given zoom on
+    most images), computed on the first use. The kernel is read only since several images use it.
+    :param width: kernel width
+    :param sx: standard deviation on x
+    :param height: kernel height
+    :param sy: standard deviation on y
+    :return: 2D array (height, width)
+    """
+    key = (width, sx, height, sy)
+    kernel = gaussian_kernels.get(key)
+    if kernel is None:
+        kernel = gaussian(width, sx, height, sy)
+        kernel.flags.writeable = False
+        gaussian_kernels.put(key, kernel)
+    return kernel
+
+
+def positions_from_columns(columns, image_data, duration=20, calc_gauss=True, start_date=None, end_date=None):
+    """
+    Same as parse_positions, from the position columns of an image store (see image_store.py) instead of csv rows.
+    The arrays use compact dtypes when they can : int16 x, y and corners (n, 4, 2), uint8 zoom and int64 timestamps.
+    Columns already in these dtypes are not copied (see image_store.Image_store memory_map).
+    :param columns: dictionary of arrays : x, y, zoom, timestamp, corners (n, 4, 2)
+    :param image_data: ImageData object to store eventual gaussians
+    :param duration: base duration for each position (updated later)
+    :param calc_gauss: Whether or not gaussians are calculated for zoom levels
+    :param start_date: remove positions before this date
+    :param end_date: remove positions after this date
+    :return: dictionary of positions
+    """
+    keep = slice(None)
+    if start_date or end_date:
+        kept = np.flatnonzero(time_mask(columns['timestamp'], start_date, end_date))
+        if len(kept) == 0:
+            keep = slice(0, 0)
+        elif kept[-1] - kept[0] + 1 == len(kept):
+            # a single block of positions (they are sorted by time), sliced instead of copied
+            keep = slice(kept[0], kept[-1] + 1)
+        else:
+            keep = kept
+    zoom = compact_array(columns['zoom'][keep], np.uint8)
+    corners = compact_array(columns['corners'][keep], np.int16)
+    # compact dtypes : the centers and corners are pixels of the thumbnail, the zoom is at most config.MAX_ZOOM
+    # and the timestamps are milliseconds. dur is the same value everywhere, a read only view of a single double.
+    ret = {'x': compact_array(columns['x'][keep], np.int16),
+           'y': compact_array(columns['y'][keep], np.int16),
+           'dur': np.broadcast_to(np.double(duration), (len(zoom),)),
+           'timestamp': compact_array(columns['timestamp'][keep], np.int64),
+           'zoom': zoom,
+           'corners': corners}
+
+    if calc_gauss:
+        set_gaussians(image_data, ret)
+    return ret
+
+
+def set_gaussians(image_data, positions, rows=None):
+    """
+    Calculates the gaussians of the zoom levels of a user the image does not have yet, from the first position
+    of each zoom level like parse_positions
+    :param image_data: ImageData object to store the gaussians
+    :param positions: dictionary of positions, or position columns of an image store
+    :param rows: optional, indexes of the positions to use (EG the ones in the time range), all of them if None
+    :return: None
+    """
+    zoom = positions['zoom'] if rows is None else positions['zoom'][rows]
+    for z in np.unique(zoom[zoom > 3]):
+        first = np.argmax(zoom == z)
+        set_gaussian(image_data, z, positions['corners'][first if rows is None else rows[first]])
+
+
+def parse_annotations(data, start_date=None, end_date=None):
     """
     parse annotations of a user in an image to a dictionary based on data read from file
     :param data: data directly read from annotation files
+    :param start_date: remove annotations before this date
     :param end_date: remove annotations after this date
     :return: dictionary of annotations
     """
-    if end_date:
-        i = 0
-        while i < len(data):
-            row_data = data[i]
-            timestamp = np.double(row_data[3])
-            if timestamp > end_date:
-                del data[i]
-            else:
-                i +=1
+    data = filter_rows(data, 3, start_date, end_date)
     # dict template
     ret = {'x': np.zeros(len(data)),
            'y': np.zeros(len(data)),
@@ -214,24 +374,17 @@ def parse_annotations(data, end_date=None):
     return ret
 
 
-def parse_annotation_actions(data, positions, annotations, end_date=None):
+def parse_annotation_actions(data, positions, annotations, start_date=None, end_date=None):
     """
     parse annotationActions of a user in an image to a dictionary based on data read from file
     :param data: data directly read from annotationActions files
     :param positions: dictionary of positions (associated to user/image pair)
     :param annotations: annotations associated to image
+    :param start_date: remove actions before this date
     :param end_date: remove actions after this date
     :return: dictionary of AnnotationActions
     """
-    if end_date:
-        i = 0
-        while i < len(data):
-            row_data = data[i]
-            timestamp = np.double(row_data[1])
-            if timestamp > end_date:
-                del data[i]
-            else:
-                i +=1
+    data = filter_rows(data, 1, start_date, end_date)
     # dict template
     ret = {'id' : np.zeros(len(data)),  # annotation id = 0 if it cannot be guessed
            'action' : [],
@@ -240,14 +393,16 @@ def parse_annotation_actions(data, positions, annotations, end_date=None):
     # fils dict
     for row in range(len(data)):
         row_data = data[row]
-
-        # guesses id if id not in file
-        if row_data[0] == "":
-            ret['id'][row] = get_nearest_annotation(row_data[1], positions, annotations)
-        else:
+        if row_data[0] != "":
             ret['id'][row] = row_data[0]
-
         ret['action'].append(row_data[2])
         ret['timestamp'][row] = row_data[1]
 
+    # guesses id if id not in file, all the actions of the user at once
+    unknown = [row for row in range(len(data)) if data[row][0] == ""]
+    if len(unknown) > 0:
+        guesses = get_nearest_annotations(ret['timestamp'][unknown], positions, annotations)
+        for row, ann_id in zip(unknown, guesses):
+            ret['id'][row] = ann_id
+
     return ret
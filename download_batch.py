@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+
+#
+# * Copyright (c) 2009-2017. Authors: see NOTICE file.
+# *
+# * Licensed under the Apache License, Version 2.0 (the "License");
+# * you may not use this file except in compliance with the License.
+# * You may obtain a copy of the License at
+# *
+# *      http://www.apache.org/licenses/LICENSE-2.0
+# *
+# * Unless required by applicable law or agreed to in writing, software
+# * distributed under the License is distributed on an "AS IS" BASIS,
+# * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# * See the License for the specific language governing permissions and
+# * limitations under the License.
+# */
+
+
+__author__          = "Vanhee Laurent <laurent.vanhee@student.uliege.ac.be>"
+__copyright__       = "Copyright 2010-2017 University of Liège, Belgium, http://www.cytomine.be/"
+
+
+import csv
+import sys
+import config
+import download_data
+from rate_limiter import Rate_limiter
+
+
+def read_jobs(jobs_file):
+    """
+    Reads a jobs file, one project per row : project_dir, id_project, users_file, ref_user_id[, modules_file].
+    A first row starting with 'project_dir' is taken as a header.
+    :param jobs_file: csv file
+    :return: list of (project_dir, id_project, users_file, id_ref_user, modules_file or None)
+    """
+    f = open(jobs_file, "rb")
+    csv_in = csv.reader(f)
+    data = [row for row in csv_in if len(row) > 0]
+    f.close()
+    if len(data) > 0 and data[0][0] == "project_dir":
+        data.pop(0)
+    jobs = []
+    for row in data:
+        modules = row[4] if len(row) > 4 and row[4] != "" else None
+        jobs.append((row[0], int(row[1]), row[2], int(row[3]), modules))
+    return jobs
+
+
+def get_batch(jobs, cytomine_host=config.cytomine_host, cytomine_public_key=config.cytomine_public_key,
+              cytomine_private_key=config.cytomine_private_key, workers=config.DOWNLOAD_WORKERS,
+              parsers=config.PARSE_WORKERS, resume=False, sync=False, stream=config.STREAM_POSITIONS,
+              store=config.IMAGE_STORE, skip_inactive=config.SKIP_INACTIVE_PAIRS):
+    """
+    Downloads several projects (EG gold and silver) in a single run. Every project gets its usual directory,
+    the (image, user) pairs of all the projects go through the same fetch threads, which keep their
+    connection to Cytomine, and the same rate limiter.
+    :param jobs: list of (project_dir, id_project, users_file, id_ref_user, modules_file or None)
+    :param cytomine_host: optional, Cytomine host address
+    :param cytomine_public_key: optional, Cytomine user public key
+    :param cytomine_private_key: optional, Cytomine user private key
+    :param workers: optional, number of (image, user) pairs downloaded at the same time
+    :param parsers: optional, number of threads turning the fetched data into rows
+    :param resume: optional, skips the units completed by a previous run (see manifest.csv)
+    :param sync: optional, only fetches the positions and actions newer than the ones already downloaded
+    :param stream: optional, fetches and writes the positions one page at a time
+    :param store: optional, also packs the positions, annotations and actions of each image in one file (see image_store.py)
+    :param skip_inactive: optional, only fetches the pairs with image consultations in the time range
+    :return: None
+    """
+    limiter = Rate_limiter()
+    projects = []
+    for project_dir, id_project, users_file, id_ref_user, modules in jobs:
+        print "Preparing project %s (%d)" % (project_dir, id_project)
+        projects.append(download_data.prepare_project(project_dir, id_project, users_file, id_ref_user,
+                                                      cytomine_host=cytomine_host,
+                                                      cytomine_public_key=cytomine_public_key,
+                                                      cytomine_private_key=cytomine_private_key, modules=modules,
+                                                      workers=workers, resume=resume, sync=sync, stream=stream,
+                                                      limiter=limiter, store=store, skip_inactive=skip_inactive))
+    try:
+        download_data.download_pairs(projects, workers, parsers)
+    finally:
+        for run, units in projects:
+            print "Project %s :" % run['project_path']
+            download_data.finish_project(run)
+
+
+def error_msg():
+    """
+    Output error msg
+    :return:
+    """
+    print "Format : download_batch.py <jobs_file>"
+    print "  <jobs_file> : CSV file, one project per row : project_dir, project_id, users_file, ref_user_id[, modules_file]"
+    print "Options :"
+    print "  -H <host>:\n    The Cytomine host address\n"
+    print "  -PR <cytomine_pr_key>\n    The user's Cytomine private key"
+    print "  -PU <cytomine_pu_key>\n    The user's Cytomine public key"
+    print "  -W <nb_workers> :\n    Number of (image, user) pairs downloaded concurrently, Default config.DOWNLOAD_WORKERS\n"
+    print "  -WP <nb_parsers> :\n    Number of threads turning the fetched data into rows, Default config.PARSE_WORKERS\n"
+    print "  --resume :\n    Resumes an interrupted download, units listed in manifest.csv whose files are intact are not fetched again\n"
+    print "  --sync :\n    Refreshes a previous download, only fetches the positions and actions newer than the ones already stored\n"
+    print "  --stream :\n    Fetches and writes the positions one page at a time, memory stays flat for very active users\n"
+    print "  --store :\n    Also packs the positions, annotations and actions of each image in one file, loaded faster by Image_data (see image_store.py)\n"
+    print "  --all-pairs :\n    Fetches every (image, user) pair, Default only the pairs with image consultations in the time range\n"
+
+
+def handle_args(args):
+    pub_key = config.cytomine_public_key
+    priv_key = config.cytomine_private_key
+    host = config.cytomine_host
+    workers = config.DOWNLOAD_WORKERS
+    parsers = config.PARSE_WORKERS
+    resume = False
+    sync = False
+    stream = config.STREAM_POSITIONS
+    store = config.IMAGE_STORE
+    skip_inactive = config.SKIP_INACTIVE_PAIRS
+    try:
+        jobs = read_jobs(str(args[1]))
+
+        i = 2
+        while i < len(args):
+            if args[i] == "-PR" and (i + 1) < len(args):
+                priv_key = str(args[i + 1])
+                i += 2
+            elif args[i] == "-PU" and (i + 1) < len(args):
+                pub_key = str(args[i + 1])
+                i += 2
+            elif args[i] == "-H" and (i + 1) < len(args):
+                host = str(args[i + 1])
+                i += 2
+            elif args[i] == "-W" and (i + 1) < len(args):
+                workers = int(args[i + 1])
+                i += 2
+            elif args[i] == "-WP" and (i + 1) < len(args):
+                parsers = int(args[i + 1])
+                i += 2
+            elif args[i] == "--resume":
+                resume = True
+                i += 1
+            elif args[i] == "--sync":
+                sync = True
+                i += 1
+            elif args[i] == "--stream":
+                stream = True
+                i += 1
+            elif args[i] == "--store":
+                store = True
+                i += 1
+            elif args[i] == "--all-pairs":
+                skip_inactive = False
+                i += 1
+            else:
+                raise ValueError(args[i])
+    except:
+        error_msg()
+        return
+
+    get_batch(jobs, cytomine_host=host, cytomine_public_key=pub_key, cytomine_private_key=priv_key, workers=workers,
+              parsers=parsers, resume=resume, sync=sync, stream=stream, store=store, skip_inactive=skip_inactive)
+
+
+if __name__ == '__main__':
+
+    handle_args(sys.argv)
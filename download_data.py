@@ -23,25 +23,191 @@ __copyright__       = "Copyright 2010-2017 University of Liège, Belgium, http:/
 
 import csv
 import datetime
+import json
 import math
 import os
-import socket
+import StringIO
 import time
 import numpy as np
 from cytomine.models import *
 from shapely.wkt import loads
 from shutil import copyfile
 import config
+from retry_policy import Retry_policy, Retry_exhausted
+from download_manifest import Download_manifest
+from property_cache import Property_cache
+from download_telemetry import Download_telemetry
+from rate_limiter import Rate_limiter
 from cytomine import Cytomine
 from PIL import Image
 import sys
 import inspect
-##TODO : add ConnectionHistory to python client and use it
+import threading
+import traceback
+from contextlib import closing
+from download_pipeline import Download_pipeline
+import image_store
+from multiprocessing.pool import ThreadPool
+
+
+class ImageConsultation(Model):
+    """
+    Opening of an image by a user (not part of the python client)
+    """
+    def __init__(self, params=None):
+        super(ImageConsultation, self).__init__(params)
+        self._callback_identifier = "imageconsultation"
+
+    def to_url(self):
+        return "imageconsultation.json"
+
+
+class ImageConsultationCollection(Collection):
+    """
+    Image consultations of a user in a project
+    """
+    def __init__(self, params=None):
+        super(ImageConsultationCollection, self).__init__(ImageConsultation, params)
+
+    def to_url(self):
+        return "project/%d/user/%d/imageconsultation.json" % (self.project, self.user)
+
+
+# per-thread Cytomine connections (the client keeps one http object per connection, it cannot be shared)
+_thread_conns = threading.local()
+
+
+def get_connection(cytomine_host, cytomine_public_key, cytomine_private_key):
+    """
+    Returns the Cytomine connection of the calling thread, it is created on first use
+    :param cytomine_host: Cytomine host address
+    :param cytomine_public_key: Cytomine user public key
+    :param cytomine_private_key: Cytomine user private key
+    :return: Cytomine connection object
+    """
+    conns = getattr(_thread_conns, 'conns', None)
+    if conns is None:
+        conns = {}
+        _thread_conns.conns = conns
+    key = (cytomine_host, cytomine_public_key, cytomine_private_key)
+    if key not in conns:
+        conns[key] = Cytomine(cytomine_host, cytomine_public_key, cytomine_private_key, base_path='/api/',
+                              working_path='/tmp/', verbose=False)
+    return conns[key]
+
+
+def fetch_url_into_file(conn, url, filename):
+    """
+    Downloads url into filename, raises an error instead of returning False so the call can be retried
+    :param conn: Cytomine connection
+    :param url: url to download
+    :param filename: output file
+    :return: None
+    """
+    if not conn.fetch_url_into_file(url, filename, override=True):
+        raise IOError("Could not download " + url)
+
+
+def no_empty_response(func):
+    """
+    Wraps a call to the Cytomine client, which returns None (or False) instead of raising on some errors : the
+    empty response raises an IOError so the call is retried
+    :param func: client method
+    :return: function with the same arguments
+    """
+    def call(*args, **kwargs):
+        ret = func(*args, **kwargs)
+        if ret is None or ret is False:
+            raise IOError("Empty response from " + func.__name__)
+        return ret
+    return call
+
+
+def open_part_file(filename, header, append=False):
+    """
+    Opens the temporary (.part) version of an output csv file, see close_part_file
+    :param filename: final name of the csv file
+    :param header: header row, written unless we append to an existing file
+    :param append: keep the rows already in filename
+    :return: (file, csv writer)
+    """
+    if append and os.path.exists(filename):
+        copyfile(filename, filename + ".part")
+        f = open(filename + ".part", "ab")
+        csvout = csv.writer(f)
+    else:
+        f = open(filename + ".part", "wb")
+        csvout = csv.writer(f)
+        csvout.writerow(header)
+    return f, csvout
+
+
+def close_part_file(f, filename):
+    """
+    Closes a file opened with open_part_file and gives it its final name (so it is never left half written)
+    :param f: file returned by open_part_file
+    :param filename: final name of the csv file
+    :return: None
+    """
+    f.close()
+    os.rename(filename + ".part", filename)
+
+
+def read_last_timestamp(filename, column):
+    """
+    Reads the newest timestamp stored in a positions/actions csv file
+    :param filename: csv file
+    :param column: index of the 'created' column
+    :return: (newest timestamp or None if the file does not exist or is empty, number of rows)
+    """
+    if not os.path.exists(filename):
+        return None, 0
+    f = open(filename, "rb")
+    csv_in = csv.reader(f)
+    data = list(csv_in)
+    f.close()
+    if len(data) < 2:
+        return None, 0
+    return max(long(float(row[column])) for row in data[1:]), len(data) - 1
+
+
+def to_timestamp(time_string):
+    """
+    Converts a "%Y-%m-%d %H:%M:%S" local time to a Cytomine timestamp (ms)
+    :param time_string: time string, EG config.start_time
+    :return: timestamp in ms
+    """
+    return long(1000 * time.mktime(datetime.datetime.strptime(time_string, "%Y-%m-%d %H:%M:%S").timetuple()))
+
+
+def read_userlist(users_metadata_file):
+    """
+    Reads the Cytomine ids of the users metadata file (first row skipped, second row is the header)
+    :param users_metadata_file: EG stats/students_gold.csv
+    :return: list of user ids
+    """
+    fusers = open(users_metadata_file, "rb")
+    csvoutusers = csv.reader(fusers)
+    data_users = list(csvoutusers)
+    data_users.pop(0)
+    header = data_users.pop(0)
+    user_idx = 0
+    for i in range(len(header)):
+        if header[i] == "CYTOMINE ID":
+            user_idx = i
+    userlist = []
+    print user_idx
+    for u_tmp in data_users:
+        userlist.append(int(u_tmp[user_idx]))
+    fusers.close()
+    return userlist
 
 
 def get_data(project_dir, id_project, users_metadata_file, id_ref_user, im_subset=None, us_subset=None,
              cytomine_host=config.cytomine_host, cytomine_public_key=config.cytomine_public_key,
-             cytomine_private_key=config.cytomine_private_key, modules=None):
+             cytomine_private_key=config.cytomine_private_key, modules=None, workers=config.DOWNLOAD_WORKERS,
+             resume=False, sync=False, stream=config.STREAM_POSITIONS, parsers=config.PARSE_WORKERS,
+             skip_inactive=config.SKIP_INACTIVE_PAIRS, store=config.IMAGE_STORE):
     """
 
     :param project_dir: gold, silver
@@ -54,12 +220,47 @@ def get_data(project_dir, id_project, users_metadata_file, id_ref_user, im_subse
     :param cytomine_private_key: optional, Cytomine user private key
     :param cytomine_public_key: optional, Cytomine user public key
     :param modules: optional, file directory containing modules
+    :param workers: optional, number of (image, user) pairs downloaded at the same time
+    :param resume: optional, skips the units completed by a previous run (see manifest.csv)
+    :param sync: optional, only fetches the positions and actions newer than the ones already downloaded
+    :param stream: optional, fetches and writes the positions one page at a time
+    :param parsers: optional, number of threads turning the fetched data into rows
+    :param skip_inactive: optional, only fetches the pairs with image consultations in the time range
+    :param store: optional, also packs the positions, annotations and actions of each image in one file (see image_store.py)
     :return:
     """
+    run, units = prepare_project(project_dir, id_project, users_metadata_file, id_ref_user, im_subset=im_subset,
+                                 us_subset=us_subset, cytomine_host=cytomine_host,
+                                 cytomine_public_key=cytomine_public_key, cytomine_private_key=cytomine_private_key,
+                                 modules=modules, workers=workers, resume=resume, sync=sync, stream=stream,
+                                 skip_inactive=skip_inactive, store=store)
+    try:
+        download_pairs([(run, units)], workers, parsers)
+    finally:
+        finish_project(run)
+
+
+def prepare_project(project_dir, id_project, users_metadata_file, id_ref_user, im_subset=None, us_subset=None,
+                    cytomine_host=config.cytomine_host, cytomine_public_key=config.cytomine_public_key,
+                    cytomine_private_key=config.cytomine_private_key, modules=None, workers=config.DOWNLOAD_WORKERS,
+                    resume=False, sync=False, stream=config.STREAM_POSITIONS, limiter=None,
+                    skip_inactive=config.SKIP_INACTIVE_PAIRS, store=config.IMAGE_STORE):
+    """
+    Opens the output files of a project, downloads its thumbnails and reference annotations, and lists its
+    (image, user) pairs. See get_data for the parameters.
+    :param limiter: optional, Rate_limiter shared with other projects downloaded from the same server
+    :return: (run settings, list of (run settings, image info, cytomine user) work units)
+    """
 
 
     #Connection to Cytomine Core
-    conn = Cytomine(cytomine_host, cytomine_public_key, cytomine_private_key, base_path = '/api/', working_path = '/tmp/', verbose= False)
+    conn = get_connection(cytomine_host, cytomine_public_key, cytomine_private_key)
+    # retry layer shared by all the calls to Cytomine, recording every request and adapting the request rate
+    # and concurrency to what the server sustains
+    telemetry = Download_telemetry()
+    if limiter is None:
+        limiter = Rate_limiter()
+    retry = Retry_policy(telemetry=telemetry, limiter=limiter)
 
     rescaled_size = 1024
     working_path = config.WORKING_DIRECTORY  # directory should exist
@@ -69,7 +270,6 @@ def get_data(project_dir, id_project, users_metadata_file, id_ref_user, im_subse
 
     timestep = 86400  # 1 day (in seconds)
 
-    id_user = 27389949  # DEMO-LANDMARK-ZEBRAFISH
     start_time = config.start_time
     end_time = config.end_time
 
@@ -83,13 +283,24 @@ def get_data(project_dir, id_project, users_metadata_file, id_ref_user, im_subse
 
 
     # We convert start/end string time to python timestamps (multiply by 1000 as python expects seconds)
-    start_timestamp = long(1000 * time.mktime(datetime.datetime.strptime(start_time, "%Y-%m-%d %H:%M:%S").timetuple()))
-    end_timestamp = long(1000 * time.mktime(datetime.datetime.strptime(end_time, "%Y-%m-%d %H:%M:%S").timetuple()))
+    start_timestamp = to_timestamp(start_time)
+    end_timestamp = to_timestamp(end_time)
+
 
+    # Completed units, kept from the previous run if we resume
+    manifest = Download_manifest(os.path.join(working_path + project_dir, 'manifest.csv'), resume=resume or sync)
 
-    # Create project stats file
+    # Create project stats file (rows of resumed pairs are rebuilt from the manifest)
     csv_stats_filename = 'stats.csv'
     stats_file = os.path.join(working_path + project_dir, csv_stats_filename)
+    # a sync adds the new data to the previous stats of each pair
+    previous_stats = {}
+    if sync and os.path.exists(stats_file):
+        fstats = open(stats_file, "rb")
+        csv_in = csv.reader(fstats)
+        for row in list(csv_in)[2:]:
+            previous_stats[(row[1], row[2])] = row
+        fstats.close()
     fstats = open(stats_file, "wb")
     csvoutstats = csv.writer(fstats)
     csvoutstats.writerow([start_timestamp, end_timestamp])
@@ -98,13 +309,13 @@ def get_data(project_dir, id_project, users_metadata_file, id_ref_user, im_subse
          'nb_positions', 'zoom_frequencies', 'nb_reference_points'])
 
     # Get all project users:
-    id_users = conn.get_project_users(id_project)  # of from arglist
+    id_users = retry.call("get_project_users", no_empty_response(conn.get_project_users), id_project)  # of from arglist
 
     # Get all image instances from project
     # Here we should check arg, if null then get all images from project
     image_instances = ImageInstanceCollection()
     image_instances.project = id_project
-    image_instances = conn.fetch(image_instances)
+    image_instances = retry.call("fetch_image_instances", no_empty_response(conn.fetch), image_instances)
     images = image_instances.data()
     print "Nb images in project: %d" % len(images)
 
@@ -125,252 +336,1130 @@ def get_data(project_dir, id_project, users_metadata_file, id_ref_user, im_subse
     users_file = os.path.join(working_path + project_dir, csv_user_filename)
     copyfile(users_metadata_file, users_file)
 
-    fusers = open(users_metadata_file, "rb")
-    csvoutusers = csv.reader(fusers)
-    data_users = list(csvoutusers)
-    data_users.pop(0)
-    header = data_users.pop(0)
-    user_idx = 0
-    for i in range(len(header)):
-        if header[i] == "CYTOMINE ID":
-            user_idx = i
-    userlist = []
-    print user_idx
-    for u_tmp in data_users:
-        userlist.append(int(u_tmp[user_idx]))
-    fusers.close()
+    userlist = read_userlist(users_metadata_file)
 
     if im_subset is None:
         im_subset = []
         for image in images:
             im_subset.append(image.id)
 
-    #Go through all images
-    for image in images:
-        id_image=image.id
-        print "Downloading data associated to image %d" %id_image
-        if id_image in im_subset:
-            image_dir = "images/image_" + str(id_image)
-            if not os.path.exists(working_path + project_dir + image_dir):
-                os.makedirs(working_path + project_dir + image_dir)
-
-            #get abstractimage thumb, compute rescaling factor (original image size / thumb size)
-            image_instance = conn.get_image_instance(id_image)
-            max_dim = max(image_instance.height,image_instance.width)
-            image_depth = image_instance.depth
-            if max_dim>rescaled_size:
-                rescale_factor = max_dim/rescaled_size
+    # annotation properties already fetched by previous runs
+    properties = Property_cache(os.path.join(working_path + project_dir, 'annotation_properties.csv'))
+
+    # settings shared by every (image, user) work unit
+    run = {'id_project': id_project,
+           'project_path': working_path + project_dir,
+           'start_timestamp': start_timestamp,
+           'end_timestamp': end_timestamp,
+           'maxperpage': maxperpage,
+           'opening_delay': opening_delay,
+           'timestep': timestep,
+           'cytomine_host': cytomine_host,
+           'cytomine_public_key': cytomine_public_key,
+           'cytomine_private_key': cytomine_private_key,
+           'retry': retry,
+           'manifest': manifest,
+           'sync': sync,
+           'stream': stream,
+           'store': store,
+           'previous_stats': previous_stats,
+           'properties': properties,
+           'telemetry': telemetry,
+           'limiter': limiter,
+           'workers': workers,
+           'writer': {'pairs': {}, 'rows': {}, 'next_row': 0, 'csvout': csvoutstats, 'file': fstats}}
+
+    # pairs with activity in the time range, the others are not fetched
+    users = [u for u in id_users.data() if u.id in userlist and (us_subset is None or u.id in us_subset)]
+    run['active'] = get_active_pairs(run, users) if skip_inactive else None
+
+    # (run, image, user) work units, in the order their stats rows are written
+    units = []
+
+    # thumbnails and reference annotations of all the images, fetched concurrently
+    selected = [image for image in images if image.id in im_subset]
+    image_infos = prefetch_images(run, selected, id_ref_user, rescaled_size)
+    run['images'] = [image_info for image_info in image_infos if image_info is not None]
+
+    for image_info in image_infos:
+        if image_info is not None:
+            # for this image, go through project's users (except those not in provided userlist)
+            for u in users:
+                units.append((run, image_info, u))
+    write_skipped_pairs(run, units)
+
+    return run, units
+
+
+def write_skipped_pairs(run, units):
+    """
+    Saves the pairs left out by the image consultations pre-pass (see get_active_pairs) in skipped_pairs.csv, so
+    that a dataset missing pairs can be checked (EG rerun with --all-pairs)
+    :param run: run settings
+    :param units: list of (run settings, image info, cytomine user) work units
+    :return: None
+    """
+    if run['active'] is None:
+        return
+    skipped = [(image_info['id_image'], u) for r, image_info, u in units
+               if (image_info['id_image'], u.id) not in run['active']]
+    f = open(os.path.join(run['project_path'], 'skipped_pairs.csv'), "wb")
+    csvout = csv.writer(f)
+    csvout.writerow(['id_image', 'id_user', 'username'])
+    for id_image, u in skipped:
+        csvout.writerow([id_image, u.id, u.username])
+    f.close()
+    print "%d of %d (image, user) pairs skipped without image consultations in the time range, see skipped_pairs.csv" \
+          % (len(skipped), len(units))
+
+
+def download_pairs(projects, workers=config.DOWNLOAD_WORKERS, parsers=config.PARSE_WORKERS):
+    """
+    Downloads the (image, user) pairs of one or several projects through a single pipeline : fetchers wait on the
+    network, parsers compute the geometry and a single writer stores the files, the manifests and the stats rows.
+    The fetch threads keep their Cytomine connection from one project to the next.
+    :param projects: list of (run settings, work units), from prepare_project
+    :param workers: number of (image, user) pairs downloaded at the same time
+    :param parsers: number of threads turning the fetched data into rows
+    :return: None
+    """
+    pipeline = Download_pipeline()
+    pipeline.add_stage("fetch", fetch_image_user, workers, on_error=fetch_failed)
+    pipeline.add_stage("parse", parse_message, parsers, on_error=parse_failed)
+    pipeline.add_stage("write", lambda message: write_message(message['unit'][0]['writer'], message))
+    nb_pairs = sum(len(units) for run, units in projects)
+    print "Downloading %d (image, user) pairs with %d fetchers and %d parsers" % (nb_pairs, workers, parsers)
+    for run, units in projects:
+        run['telemetry'].start(len(units), pipeline)
+    pipeline.start()
+    for run, units in projects:
+        for i in range(len(units)):
+            pipeline.put((i, units[i]))
+    pipeline.join()
+    print pipeline.report()
+
+
+def finish_project(run):
+    """
+    Closes the output files of a project, and saves its telemetry and failures
+    :param run: run settings, from prepare_project
+    :return: None
+    """
+    run['writer']['file'].close()
+    run['manifest'].close()
+    telemetry = run['telemetry']
+    telemetry.stop()
+    print telemetry.summary()
+    print "Rate limit at the end of the download : %s" % run['limiter']
+    telemetry.write(os.path.join(run['project_path'], 'telemetry.json'))
+
+    # binary positions, read by Image_data instead of the csv files
+    if run['store']:
+        for image_info in run['images']:
+            image_store.write_image_store(image_info['image_path'])
+        print "Image store written for %d images" % len(run['images'])
+
+    # keep track of what was given up on
+    retry = run['retry']
+    if len(retry.failures) > 0:
+        print "%d downloads were given up on, see failures.csv" % len(retry.failures)
+    retry.write_failures(os.path.join(run['project_path'], 'failures.csv'))
+
+
+def prefetch_images(run, images, id_ref_user, rescaled_size):
+    """
+    Downloads the thumbnails and reference annotations of several images at the same time, so that the (image, user)
+    pairs can start as soon as possible
+    :param run: run settings
+    :param images: list of Cytomine image instances
+    :param id_ref_user: user id of the reference annotations (None if there are none)
+    :param rescaled_size: max size of the thumbnails
+    :return: list of image info (from prepare_image) in the order of images, None for the images given up on
+    """
+    if len(images) > 1 and run['workers'] > 1:
+        with closing(ThreadPool(min(run['workers'], len(images)))) as pool:
+            image_infos = pool.map(lambda image: prefetch_image(run, image.id, id_ref_user, rescaled_size), images)
+        pool.join()
+    else:
+        image_infos = [prefetch_image(run, image.id, id_ref_user, rescaled_size) for image in images]
+    run['properties'].save()
+    return image_infos
+
+
+def prefetch_image(run, id_image, id_ref_user, rescaled_size):
+    """
+    Creates the directories of an image and downloads its thumbnail and reference annotations
+    :param run: run settings
+    :param id_image: image id
+    :param id_ref_user: user id of the reference annotations (None if there are none)
+    :param rescaled_size: max size of the thumbnail
+    :return: image info (from prepare_image), None if the image was given up on
+    """
+    print "Downloading data associated to image %d" %id_image
+    conn = get_connection(run['cytomine_host'], run['cytomine_public_key'], run['cytomine_private_key'])
+    image_path = run['project_path'] + "images/image_" + str(id_image)
+    if not os.path.exists(image_path):
+        os.makedirs(image_path)
+
+    try:
+        image_info = prepare_image(conn, run, id_image, id_ref_user, rescaled_size, image_path)
+    except Exception as e:
+        # the image is given up on, the other images go on
+        if not isinstance(e, Retry_exhausted):
+            traceback.print_exc()
+        run['retry'].add_failure(id_image, None, e, endpoint="prepare_image")
+        return None
+
+    for sub_dir in ["/user_positions", "/user_annotations", "/user_actions"]:
+        if not os.path.exists(image_path + sub_dir):
+            os.makedirs(image_path + sub_dir)
+    return image_info
+
+
+def prepare_image(conn, run, id_image, id_ref_user, rescaled_size, image_path):
+    """
+    Downloads the thumbnail and the reference annotations of an image
+    :param conn: Cytomine connection
+    :param run: run settings
+    :param id_image: image id
+    :param id_ref_user: user id of the reference annotations (None if there are none)
+    :param rescaled_size: max size of the thumbnail
+    :param image_path: directory of the image data
+    :return: dictionary with the image info needed by the (image, user) work units
+    """
+    retry = run['retry']
+    manifest = run['manifest']
+    #get abstractimage thumb, compute rescaling factor (original image size / thumb size)
+    image_instance = retry.call("get_image_instance", no_empty_response(conn.get_image_instance), id_image)
+    rescale_factor = get_rescale_factor(image_instance, rescaled_size)
+
+    url = image_instance.preview[0:image_instance.preview.index('?')] + "?maxSize=" + str(rescaled_size)
+    filename = image_path + "/image.png"
+
+    # the thumbnail and the reference annotations are fetched again if the image changed since they were downloaded
+    info_file = image_path + "/image.json"
+    image_meta = {'preview': url, 'width': image_instance.width, 'height': image_instance.height}
+    previous_meta = None
+    if os.path.exists(info_file):
+        f = open(info_file, "rb")
+        previous_meta = json.load(f)
+        f.close()
+    changed = previous_meta is not None and previous_meta != image_meta
+
+    if changed or not os.path.exists(filename):
+        retry.call("fetch_url_into_file", fetch_url_into_file, conn, url, filename + ".part")
+        os.rename(filename + ".part", filename)
+    if previous_meta != image_meta:
+        f = open(info_file + ".part", "wb")
+        json.dump(image_meta, f)
+        f.close()
+        os.rename(info_file + ".part", info_file)
+
+    # reference annotations, unless they are already in the manifest
+    output_annotation_file = os.path.join(image_path + "/", 'reference_cytomine_annotations.csv')
+    ref = None if changed else manifest.get(id_image, "", 'reference', output_annotation_file)
+    if ref is None:
+        nb_ref_annotations = download_reference_annotations(conn, run, id_image, id_ref_user, rescale_factor,
+                                                            output_annotation_file)
+        add_unit(run, id_image, "", 'reference', output_annotation_file, nb_ref_annotations)
+    else:
+        nb_ref_annotations = ref['nb_rows']
+
+    return {'id_image': id_image,
+            'image_path': image_path,
+            'width': image_instance.width,
+            'height': image_instance.height,
+            'depth': image_instance.depth,
+            'rescale_factor': rescale_factor,
+            'nb_ref_annotations': nb_ref_annotations}
+
+
+def fetch_consultations(run, u):
+    """
+    Fetches the image consultations of a user in the project
+    :param run: run settings
+    :param u: cytomine user
+    :return: list of ImageConsultation objects
+    """
+    conn = get_connection(run['cytomine_host'], run['cytomine_public_key'], run['cytomine_private_key'])
+    consultations = ImageConsultationCollection()
+    consultations.project = run['id_project']
+    consultations.user = u.id
+    return run['retry'].call("get_image_consultations", no_empty_response(conn.fetch), consultations).data()
+
+
+def get_active_pairs(run, users):
+    """
+    Pre-pass listing the (image, user) pairs with some activity in the time range, from the image consultations
+    of each user : one request per user instead of 3 per (image, user) pair. Positions, annotations and actions
+    are only created while an image is opened, so the other pairs have nothing to fetch. Consultations started
+    up to config.ACTIVITY_MARGIN before the time range are kept, the user may still be browsing in it.
+    :param run: run settings
+    :param users: list of the selected cytomine users
+    :return: set of (id_image, id_user), None if the consultations could not be fetched (every pair is downloaded).
+             A permanent error (EG 404 on the Cytomine cores without the endpoint) is not retried, see Retry_policy.
+    """
+    try:
+        if len(users) > 1 and run['workers'] > 1:
+            with closing(ThreadPool(min(run['workers'], len(users)))) as pool:
+                user_consultations = pool.map(lambda u: fetch_consultations(run, u), users)
+            pool.join()
+        else:
+            user_consultations = [fetch_consultations(run, u) for u in users]
+    except Exception as e:
+        # the pre-pass only saves requests, any error falls back to the full download
+        print "Image consultations not available (%r), downloading every (image, user) pair" % e
+        return None
+
+    active = set()
+    for u, consultations in zip(users, user_consultations):
+        for c in consultations:
+            if run['start_timestamp'] - config.ACTIVITY_MARGIN < float(c.created) < run['end_timestamp']:
+                active.add((int(c.image), u.id))
+    print "%d (image, user) pairs with activity in the time range" % len(active)
+    return active
+
+
+def get_rescale_factor(image_instance, rescaled_size):
+    """
+    :param image_instance: Cytomine image instance
+    :param rescaled_size: max size of the thumbnail
+    :return: original image size / thumbnail size
+    """
+    max_dim = max(image_instance.height,image_instance.width)
+    if max_dim>rescaled_size:
+        rescale_factor = max_dim/rescaled_size
+    else:
+        rescale_factor=1
+    return rescale_factor
+
+
+def download_reference_annotations(conn, run, id_image, id_ref_user, rescale_factor, output_annotation_file):
+    """
+    Downloads the reference annotations of an image and saves their (rescaled) centers in a csv file
+    :param conn: Cytomine connection
+    :param run: run settings
+    :param id_image: image id
+    :param id_ref_user: user id of the reference annotations (None if there are none)
+    :param rescale_factor: original image size / thumbnail size
+    :param output_annotation_file: output csv file (only created if there are reference annotations)
+    :return: number of reference annotations
+    """
+    # Get reference annotations in this image (to detect if reference regions were visualized by user)
+    nb_ref_annotations = 0
+    if id_ref_user:
+        ref_annotations = run['retry'].call("get_annotations", no_empty_response(conn.get_annotations),
+                                            id_image=id_image,
+                                            id_user=id_ref_user,
+                                            id_project=run['id_project'],
+                                            showWKT=True
+                                            )
+        nb_ref_annotations = len(ref_annotations.data())
+    else:
+        ref_annotations = None
+    #save the center of the reference annotations in a csv file
+    if nb_ref_annotations > 0:
+
+        f, csv_annotations = open_part_file(output_annotation_file,
+                                            ['type', 'x_center', 'y_center', 'annotationIdent', 'localIdent'])
+        local_ids = get_local_ids(run, ref_annotations.data())
+        for a in ref_annotations.data():
+
+            l_id = local_ids[a.id]
+
+            geom = loads(a.location)
+
+            if geom.type == 'Point':
+                csv_annotations.writerow([geom.type, round(geom.x / rescale_factor), round(geom.y / rescale_factor), a.id, l_id])
             else:
-                rescale_factor=1
-
-            url = image_instance.preview[0:image_instance.preview.index('?')] + "?maxSize=" + str(rescaled_size)
-            filename = working_path + project_dir + image_dir + "/image.png"
-            if not os.path.exists(filename):
-                conn.fetch_url_into_file(url, filename, override=True)
-
-            rescaled_im = Image.open(filename)
-            rescaled_width, rescaled_height = rescaled_im.size
-
-            # Get reference annotations in this image (to detect if reference regions were visualized by user)
-            nb_ref_annotations = 0
-            if id_ref_user:
-                ref_annotations = conn.get_annotations(id_image=id_image,
-                                                       id_user=id_ref_user,
-                                                       id_project=id_project,
-                                                       showWKT=True
-                                                       )
-                nb_ref_annotations = len(ref_annotations.data())
+                csv_annotations.writerow([geom.type, round(geom.centroid.x / rescale_factor), round(geom.centroid.y / rescale_factor), a.id, l_id])
+        close_part_file(f, output_annotation_file)
+
+    return nb_ref_annotations
+
+
+def get_local_ids(run, annotations):
+    """
+    Gets the 'n' property (local id) of annotations. Cytomine has no bulk property endpoint, so the
+    annotations missing from the property cache are fetched concurrently, one request each.
+    :param run: run settings
+    :param annotations: list of Annotation objects
+    :return: dictionary annotation id -> local id
+    """
+    properties = run['properties']
+    ret = {}
+    missing = []
+    for a in annotations:
+        l_id = properties.get(a.id, getattr(a, 'updated', None))
+        if l_id is None:
+            missing.append(a)
+        else:
+            ret[a.id] = l_id
+
+    if len(missing) > 1 and run['workers'] > 1:
+        with closing(ThreadPool(min(run['workers'], len(missing)))) as pool:
+            local_ids = pool.map(lambda a: fetch_local_id(run, a), missing)
+        pool.join()
+    else:
+        local_ids = [fetch_local_id(run, a) for a in missing]
+
+    for a, l_id in zip(missing, local_ids):
+        properties.set(a.id, getattr(a, 'updated', None), l_id)
+        ret[a.id] = l_id
+    return ret
+
+
+def fetch_local_id(run, a):
+    """
+    Fetches the 'n' property (local id) of an annotation
+    :param run: run settings
+    :param a: Annotation object
+    :return: local id (0 if the annotation has none)
+    """
+    conn = get_connection(run['cytomine_host'], run['cytomine_public_key'], run['cytomine_private_key'])
+    descr = run['retry'].call("get_annotation_properties", no_empty_response(conn.get_annotation_properties), a.id)
+    l_id = 0
+    for prop in descr.data():
+        if prop.key == 'n':
+            l_id = prop.value
+    return l_id
+
+
+def add_unit(run, id_image, id_user, endpoint, filename, nb_rows, summary=None):
+    """
+    Records a completed unit in the manifest and in the telemetry
+    :param run: run settings
+    :param id_image: image id
+    :param id_user: user id ("" for image level units)
+    :param endpoint: positions, annotations, actions, reference
+    :param filename: output file of the unit
+    :param nb_rows: number of rows written
+    :param summary: optional dictionary of values needed to rebuild stats without the data
+    :return: None
+    """
+    run['manifest'].add(id_image, id_user, endpoint, filename, nb_rows, summary)
+    nb_bytes = os.path.getsize(filename) if os.path.exists(filename) else 0
+    run['telemetry'].record_rows(endpoint, nb_rows, nb_bytes)
+
+
+def pair_files(image_info, u):
+    """
+    Output files of one user in one image
+    :param image_info: image info (from prepare_image)
+    :param u: cytomine user
+    :return: dictionary endpoint -> csv file
+    """
+    prefix = str(u.id) + "_" + str(u.username)
+    return {'positions': os.path.join(image_info['image_path'] + "/user_positions", prefix + '_cytomine_positions.csv'),
+            'annotations': os.path.join(image_info['image_path'] + "/user_annotations", prefix + '_cytomine_annotations.csv'),
+            'actions': os.path.join(image_info['image_path'] + "/user_actions", prefix + '_cytomine_actions.csv')}
+
+
+def fetch_image_user(data):
+    """
+    Fetch stage of the download pipeline : requests the positions, annotations and annotation actions of one user
+    in one image and passes the responses on, in order. Units already completed in the manifest are not fetched
+    again. In sync mode, only the positions and actions newer than the ones already stored are fetched.
+    :param data: (index of the pair, (run settings, image info, cytomine user))
+    :return: generator of messages for the parse stage, the last one is an 'end' message
+    """
+    index, unit = data
+    run, image_info, u = unit
+    conn = get_connection(run['cytomine_host'], run['cytomine_public_key'], run['cytomine_private_key'])
+    retry = run['retry']
+    manifest = run['manifest']
+    sync = run['sync']
+    id_image = image_info['id_image']
+    id_user = u.id
+    files = pair_files(image_info, u)
+    seq = [0]
+
+    def message(endpoint, **values):
+        values.update({'index': index, 'seq': seq[0], 'unit': unit, 'endpoint': endpoint})
+        seq[0] += 1
+        return values
+
+    if run['active'] is not None and (id_image, id_user) not in run['active']:
+        # nothing to fetch, the pair still gets its stats row
+        yield message('inactive')
+        yield message('end')
+        return
+
+    try:
+        pos = None if sync else manifest.get(id_image, id_user, 'positions', files['positions'])
+        if pos is not None:
+            yield message('cached', name='positions', summary=pos['summary'])
+        else:
+            last, nb_old = read_last_timestamp(files['positions'], 3) if sync else (None, 0)
+            afterthan = run['start_timestamp'] if last is None else last
+            for page in fetch_positions(conn, run, image_info, id_user, afterthan):
+                yield message('positions', page=page, afterthan=afterthan)
+            yield message('positions_end', afterthan=afterthan, last=last, nb_old=nb_old)
+
+        # annotations are not filtered by date by Cytomine, a sync fetches them again
+        ann = None if sync else manifest.get(id_image, id_user, 'annotations', files['annotations'])
+        if ann is not None:
+            yield message('cached', name='annotations', summary=ann['summary'])
+        else:
+            annotations = retry.call("get_annotations", no_empty_response(conn.get_annotations),
+                                     id_image=id_image,
+                                     id_user=id_user,
+                                     id_project=run['id_project'])
+            yield message('annotations', data=annotations.data())
+
+        if sync or manifest.get(id_image, id_user, 'actions', files['actions']) is None:
+            last, nb_old = read_last_timestamp(files['actions'], 1) if sync else (None, 0)
+            afterthan = run['start_timestamp'] if last is None else last
+            ann_actions = retry.call("get_annoationactions", no_empty_response(conn.get_annoationactions),
+                                     id_image=id_image,
+                                     id_user=id_user,
+                                     maxperpage=run['maxperpage'],
+                                     afterthan=afterthan,
+                                     beforethan=run['end_timestamp'],
+                                     showDetails=True)
+            yield message('actions', data=ann_actions.data(), afterthan=afterthan, last=last, nb_old=nb_old)
+
+    except Retry_exhausted as e:
+        retry.add_failure(id_image, id_user, e)
+        yield message('failed')
+
+    yield message('end')
+
+
+def failed_messages(message, seq):
+    """
+    Messages giving up on a pair, so that the writer drops its partial files and moves on to the next pair
+    :param message: a message of the pair
+    :param seq: position of the 'failed' message in the messages of the pair
+    :return: list of messages (failed, end)
+    """
+    return [{'index': message['index'], 'seq': seq, 'unit': message['unit'], 'endpoint': 'failed'},
+            {'index': message['index'], 'seq': seq + 1, 'unit': message['unit'], 'endpoint': 'end'}]
+
+
+def fetch_failed(data, error, nb_sent):
+    """
+    Called by the fetch stage when fetch_image_user raises an error other than Retry_exhausted : the pair is given up on
+    :param data: (index of the pair, (run settings, image info, cytomine user))
+    :param error: exception
+    :param nb_sent: number of messages of the pair already passed on
+    :return: list of messages ending the pair
+    """
+    index, unit = data
+    run, image_info, u = unit
+    run['retry'].add_failure(image_info['id_image'], u.id, error, endpoint="fetch")
+    return failed_messages({'index': index, 'unit': unit}, nb_sent)
+
+
+def parse_failed(message, error, nb_sent):
+    """
+    Called by the parse stage when a message cannot be parsed : the pair is given up on, its next messages are
+    ignored by the writer
+    :param message: message from the fetch stage
+    :param error: exception
+    :param nb_sent: always 0, parse_message passes on a single message
+    :return: list with the 'failed' message replacing the message
+    """
+    run, image_info, u = message['unit']
+    run['retry'].add_failure(image_info['id_image'], u.id, error, endpoint="parse_" + message['endpoint'])
+    if message['endpoint'] == 'end':
+        return [message]
+    return failed_messages(message, message['seq'])[:1]
+
+
+def parse_message(message):
+    """
+    Parse stage of the download pipeline : turns the Cytomine objects of a message into csv rows
+    :param message: message from the fetch stage
+    :return: list with the message for the write stage
+    """
+    run, image_info, u = message['unit']
+    endpoint = message['endpoint']
+    if endpoint == 'positions':
+        message.update(parse_position_page(run, image_info, message['afterthan'], message.pop('page')))
+    elif endpoint == 'annotations':
+        message.update(parse_annotations(run, message.pop('data')))
+    elif endpoint == 'actions':
+        message.update(parse_actions(run, message['afterthan'], message.pop('data')))
+    return [message]
+
+
+def write_message(writer, message):
+    """
+    Write stage of the download pipeline, runs in a single thread. Messages of a pair can come out of order from
+    the parse workers, they are handled in the order they were fetched. The stats.csv rows are written in the
+    order of the pairs.
+    :param writer: writer state (run settings, stats.csv writer, pairs in progress)
+    :param message: message from the parse stage
+    :return: None
+    """
+    index = message['index']
+    pair = writer['pairs'].get(index)
+    if pair is None:
+        run, image_info, u = message['unit']
+        pair = {'next': 0, 'pending': {}, 'failed': False, 'files': pair_files(image_info, u), 'f': None,
+                'nb_rows': 0, 'nb_opens': 0, 'zooms': np.zeros(image_info['depth']), 'previous_central': None,
+                'nb_annotations': 0}
+        writer['pairs'][index] = pair
+    pair['pending'][message['seq']] = message
+    while pair['next'] in pair['pending']:
+        message = pair['pending'].pop(pair['next'])
+        pair['next'] += 1
+        try:
+            row = write_pair_message(pair, message)
+        except Exception as e:
+            # the pair is given up on (see failures.csv), the writer goes on with the other pairs
+            traceback.print_exc()
+            run, image_info, u = message['unit']
+            run['retry'].add_failure(image_info['id_image'], u.id, e, endpoint="write_" + message['endpoint'])
+            write_pair_message(pair, failed_messages(message, message['seq'])[0])
+            row = None
+        if message['endpoint'] == 'end':
+            del writer['pairs'][index]
+            writer['rows'][index] = row
+
+    # stats rows in the order of the pairs
+    while writer['next_row'] in writer['rows']:
+        row = writer['rows'].pop(writer['next_row'])
+        writer['next_row'] += 1
+        if row is not None:
+            writer['csvout'].writerow(row)
+            writer['file'].flush()
+
+
+def write_pair_message(pair, message):
+    """
+    Writes one message of a pair
+    :param pair: state of the pair (open positions file, stats so far)
+    :param message: message from the parse stage
+    :return: the stats.csv row of the pair for its 'end' message (None if the pair was given up on)
+    """
+    run, image_info, u = message['unit']
+    id_image = image_info['id_image']
+    id_user = u.id
+    endpoint = message['endpoint']
+    files = pair['files']
+
+    if pair['failed'] and endpoint not in ['failed', 'end']:
+        # given up on, the rest of the data is not written
+        return None
+
+    if endpoint == 'cached':
+        summary = message['summary']
+        if message['name'] == 'positions':
+            pair['nb_opens'] = summary['nb_opens']
+            pair['zooms'] = np.array(summary['zooms'])
+        else:
+            pair['nb_annotations'] = summary['nb_annotations']
+
+    elif endpoint == 'positions':
+        if pair['f'] is None:
+            #create output csv file to store positions, renamed once complete
+            pair['f'], pair['csvout'] = open_part_file(files['positions'], ['corners', 'center', 'zoom', 'created'],
+                                                       append=message['afterthan'] != run['start_timestamp'])
+        for row in message['rows']:
+            pair['csvout'].writerow(row)
+        pair['nb_rows'] += len(message['rows'])
+        pair['zooms'] += message['zooms']
+        if pair['previous_central'] is None:
+            pair['previous_central'] = float(message['afterthan'])
+        for created in message['central']:
+            if created - pair['previous_central'] > run['opening_delay']:  # if > 10s we assume user opens the image again
+                pair['nb_opens'] += 1
+            pair['previous_central'] = created
+
+    elif endpoint == 'positions_end':
+        if pair['f'] is not None:
+            close_part_file(pair['f'], files['positions'])
+            pair['f'] = None
+        # a sync adds the new positions to the previous stats, unless the whole time range was fetched again
+        previous = run['previous_stats'].get((str(id_image), str(id_user)))
+        if message['last'] is not None and previous is not None:
+            pair['nb_opens'] += int(previous[6])
+            pair['zooms'] += np.array(previous[8].strip('[]').split(), dtype=float)
+        add_unit(run, id_image, id_user, 'positions', files['positions'], message['nb_old'] + pair['nb_rows'],
+                 {'nb_opens': pair['nb_opens'], 'zooms': pair['zooms'].tolist()})
+
+    elif endpoint == 'annotations':
+        pair['nb_annotations'] = message['nb_annotations']
+        if message['nb_annotations'] > 0:
+            print "We actually have at least 1 annotation"
+            f, csv_annotations = open_part_file(files['annotations'], ['type', 'x_center', 'y_center', 'annotationIdent'])
+            for row in message['rows']:
+                csv_annotations.writerow(row)
+            close_part_file(f, files['annotations'])
+        add_unit(run, id_image, id_user, 'annotations', files['annotations'], len(message['rows']),
+                 {'nb_annotations': message['nb_annotations']})
+
+    elif endpoint == 'actions':
+        if message['nb_actions'] > 0:
+            #create output csv file to store actions, renamed once complete
+            f, csvout = open_part_file(files['actions'], ['annotationIdent', 'created', 'action'],
+                                       append=message['last'] is not None)
+            for row in message['rows']:
+                csvout.writerow(row)
+            close_part_file(f, files['actions'])
+        add_unit(run, id_image, id_user, 'actions', files['actions'], message['nb_old'] + len(message['rows']), {})
+
+    elif endpoint == 'inactive':
+        # zero stats, or the previous ones for a sync
+        previous = run['previous_stats'].get((str(id_image), str(id_user)))
+        if previous is not None:
+            pair['nb_annotations'] = int(previous[5])
+            pair['nb_opens'] = int(previous[6])
+            pair['zooms'] = np.array(previous[8].strip('[]').split(), dtype=float)
+
+    elif endpoint == 'failed':
+        pair['failed'] = True
+        if pair['f'] is not None:
+            pair['f'].close()
+            pair['f'] = None
+        for filename in files.values():
+            if os.path.exists(filename + ".part"):
+                os.remove(filename + ".part")
+
+    elif endpoint == 'end':
+        run['telemetry'].pair_done()
+        if pair['failed']:
+            return None
+        zooms = pair['zooms']
+        return [run['id_project'], id_image, id_user, u.username, u.email, pair['nb_annotations'], pair['nb_opens'],
+                sum(zooms), zooms, image_info['nb_ref_annotations']]
+
+    return None
+
+
+def round_half_away(values):
+    """
+    Python 2 round() (halves are rounded away from zero) applied to a whole array
+    :param values: numpy array
+    :return: rounded numpy array
+    """
+    a = np.abs(values)
+    r = np.floor(a + 0.5)
+    # a + 0.5 can be rounded up by the float addition (EG 0.49999999999999994)
+    r[r - 0.5 > a] -= 1
+    return np.copysign(r, values)
+
+
+def rescale_viewports(locations, rescale_factor):
+    """
+    Rescaled corners and centers of a page of position viewports, computed with numpy for the whole page.
+    The viewports are rectangles "POLYGON ((x0 y0, x1 y1, x2 y2, x3 y3, x0 y0))", their centroid is computed
+    with the same triangle fan as GEOS so the values are identical to shapely's. Any other geometry goes
+    through shapely.
+    :param locations: list of WKT strings
+    :param rescale_factor: original image size / thumbnail size
+    :return: (list of rescaled corner lists, list of rescaled (x, y) centers)
+    """
+    inner = [l[l.find("((") + 2:-2] for l in locations]
+    fast = [l.startswith("POLYGON") and l.endswith("))") and "(" not in s and s.count(",") == 4
+            for l, s in zip(locations, inner)]
+    values = np.fromstring(" ".join(s for s, ok in zip(inner, fast) if ok).replace(",", " "), sep=" ")
+    if len(values) != 10 * sum(fast):
+        # something else than 2D coordinates, let shapely handle the whole page
+        fast = [False] * len(locations)
+        values = np.zeros(0)
+    coords = values.reshape(-1, 5, 2)
+
+    corners = round_half_away(coords[:, :4, :] / rescale_factor).tolist()
+    p0 = coords[:, 0, :]
+    cx = np.zeros(len(coords))
+    cy = np.zeros(len(coords))
+    area = np.zeros(len(coords))
+    for i in range(4):
+        p1 = coords[:, i, :]
+        p2 = coords[:, i + 1, :]
+        area2 = (p1[:, 0] - p0[:, 0]) * (p2[:, 1] - p0[:, 1]) - (p2[:, 0] - p0[:, 0]) * (p1[:, 1] - p0[:, 1])
+        cx += area2 * (p0[:, 0] + p1[:, 0] + p2[:, 0])
+        cy += area2 * (p0[:, 1] + p1[:, 1] + p2[:, 1])
+        area += area2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        centers = round_half_away(np.column_stack((cx / 3 / area, cy / 3 / area)) / rescale_factor).tolist()
+
+    ret_corners = []
+    ret_centers = []
+    k = 0
+    for location, ok in zip(locations, fast):
+        if ok and area[k] != 0:
+            ret_corners.append([tuple(corner) for corner in corners[k]])
+            ret_centers.append(tuple(centers[k]))
+        else:
+            geom = loads(location)
+            rescaled_corners = list(geom.exterior.coords)
+            rescaled_corners.pop()
+            ret_corners.append([tuple(map(lambda divide : round(divide / rescale_factor), corner)) for corner in rescaled_corners])
+            ret_centers.append((round(geom.centroid.x / rescale_factor), round(geom.centroid.y / rescale_factor)))
+        if ok:
+            k += 1
+    return ret_corners, ret_centers
+
+
+def fetch_position_page(conn, id_image, id_user, afterthan, beforethan, offset, maxperpage):
+    """
+    Fetches a single page of positions (the client's get_positions fetches all the pages before returning)
+    :param conn: Cytomine connection
+    :param id_image: image id
+    :param id_user: user id
+    :param afterthan: start timestamp
+    :param beforethan: end timestamp
+    :param offset: index of the first position of the page
+    :param maxperpage: size of the page
+    :return: list of Position objects
+    """
+    positions = PositionCollection()
+    positions.imageinstance = id_image
+    positions.user = id_user
+    positions.afterthan = afterthan
+    positions.beforethan = beforethan
+    positions.showDetails = True
+    return no_empty_response(conn.fetch)(positions, query_string="max=%d&offset=%d" % (maxperpage, offset)).data()
+
+
+def iter_position_pages(conn, retry, id_image, id_user, afterthan, beforethan, maxperpage):
+    """
+    Walks the pages of positions of a user in an image, one request per page, so that only
+    one page is held in memory at a time
+    :param conn: Cytomine connection
+    :param retry: Retry_policy object
+    :param id_image: image id
+    :param id_user: user id
+    :param afterthan: start timestamp
+    :param beforethan: end timestamp
+    :param maxperpage: size of the pages
+    :return: generator of lists of Position objects
+    """
+    offset = 0
+    while True:
+        page = retry.call("get_positions", fetch_position_page, conn, id_image, id_user, afterthan, beforethan,
+                          offset, maxperpage)
+        if len(page) > 0:
+            yield page
+        if len(page) < maxperpage:
+            return
+        offset += maxperpage
+
+
+def fetch_positions(conn, run, image_info, id_user, afterthan):
+    """
+    Requests the positions of a user in an image
+    :param conn: Cytomine connection
+    :param run: run settings
+    :param image_info: image info (from prepare_image)
+    :param id_user: user id
+    :param afterthan: only fetches the positions created after this timestamp
+    :return: iterable of non empty lists of Position objects
+    """
+    # Get_positions for this user in this image: using paging (maxperpage) and using start/end timestamps
+    if run['stream']:
+        # pages are passed on as they arrive
+        return iter_position_pages(conn, run['retry'], image_info['id_image'], id_user, afterthan,
+                                   run['end_timestamp'], run['maxperpage'])
+    positions = run['retry'].call("get_positions", no_empty_response(conn.get_positions),
+                                  id_image=image_info['id_image'],
+                                  id_user=id_user,
+                                  maxperpage=run['maxperpage'],
+                                  afterthan=afterthan,
+                                  beforethan=run['end_timestamp'],
+                                  showDetails=True)
+    return [positions.data()] if len(positions.data()) > 0 else []
+
+
+def parse_position_page(run, image_info, afterthan, page):
+    """
+    Filters a page of positions and computes their rescaled viewports
+    :param run: run settings
+    :param image_info: image info (from prepare_image)
+    :param afterthan: start timestamp of the request
+    :param page: list of Position objects
+    :return: {'rows': csv rows, 'zooms': zoom level counts, 'central': creation times of the central positions}
+    """
+    end_timestamp = run['end_timestamp']
+    zooms = np.zeros(image_info['depth'])
+    central = []
+
+    #Filter obtained positions based on start/end timestamp (only write in csv positions included in the given time interval)
+    kept = []
+    for p in page:
+        if float(p.created) > float(afterthan) and float(p.created) < float(end_timestamp):
+            if (p.x != image_info['width'] / 2) and (p.y != image_info['height'] / 2):
+                kept.append(p)
+                zooms[p.zoom - 1] += 1
+            else:
+                # the image is opened centered, these positions count the openings
+                central.append(float(p.created))
+        else:
+            print "Point removed because not in the timeframe"  # should not happen
+
+    # geometry of the whole page at once
+    rescaled_corners, rescaled_centers = rescale_viewports([p.location for p in kept], image_info['rescale_factor'])
+    rows = [[corners, center, int(p.zoom), float(p.created)]
+            for p, corners, center in zip(kept, rescaled_corners, rescaled_centers)]
+    return {'rows': rows, 'zooms': zooms, 'central': central}
+
+
+def parse_annotations(run, annotations):
+    """
+    Filters the annotations of a user in an image and computes their centers
+    :param run: run settings
+    :param annotations: list of Annotation objects
+    :return: {'rows': csv rows, 'nb_annotations': number of annotations before filtering}
+    """
+    start_timestamp = run['start_timestamp']
+    end_timestamp = run['end_timestamp']
+    rows = []
+    for a in annotations:
+        if float(a.created) > float(start_timestamp) and float(a.created) < float(end_timestamp):
+            geom = loads(a.location)
+            if geom.type == 'Point':
+                rows.append([geom.type, geom.x, geom.y, a.id])
             else:
-                ref_annotations = None
-            #save the center of the reference annotations in a csv file
-            csv_filename = 'reference_cytomine_annotations.csv'
-            if nb_ref_annotations > 0:
+                rows.append([geom.type, geom.centroid.x, geom.centroid.y, a.id])
+    return {'rows': rows, 'nb_annotations': len(annotations)}
 
-                output_annotation_file = os.path.join(working_path + project_dir + image_dir + "/", csv_filename)
-                f = open(output_annotation_file, "wb")
-                csv_annotations = csv.writer(f)
-                csv_annotations.writerow(['type', 'x_center', 'y_center', 'annotationIdent', 'localIdent'])
-                for a in ref_annotations.data():
 
-                    descr = conn.get_annotation_properties(a.id)
-                    l_id = 0
-                    for prop in descr.data():
-                        if prop.key == 'n':
-                            l_id = prop.value
+def parse_actions(run, afterthan, ann_actions):
+    """
+    Filters the annotation actions of a user in an image
+    :param run: run settings
+    :param afterthan: start timestamp of the request
+    :param ann_actions: list of AnnotationAction objects
+    :return: {'rows': csv rows, 'nb_actions': number of actions before filtering}
+    """
+    end_timestamp = run['end_timestamp']
+    #Filter obtained actions based on start/end timestamp (only write in csv actions included in the given time interval)
+    rows = [[a.annotationIdent, a.created, a.action] for a in ann_actions
+            if float(a.created) > float(afterthan) and float(a.created) < float(end_timestamp)]
+    return {'rows': rows, 'nb_actions': len(ann_actions)}
 
 
-                    geom = loads(a.location)
+def count_lines(filename):
+    """
+    :param filename: text file
+    :return: number of lines of the file
+    """
+    f = open(filename, "rb")
+    nb_lines = sum(1 for line in f)
+    f.close()
+    return nb_lines
 
-                    if geom.type == 'Point':
-                        csv_annotations.writerow([geom.type, round(geom.x / rescale_factor), round(geom.y / rescale_factor), a.id, l_id])
-                    else:
-                        csv_annotations.writerow([geom.type, round(geom.centroid.x / rescale_factor), round(geom.centroid.y / rescale_factor), a.id, l_id])
-                f.close()
 
-            # for this image, go through project's users (except those not in provided userlist)
-            for u in id_users.data():
-                if u.id in userlist and (us_subset is None or u.id in us_subset ):
-
-                    zooms = np.zeros(image_instance.depth)
-                    id_user = u.id
-                    if not os.path.exists(working_path + project_dir + image_dir + "/user_positions"):
-                        os.makedirs(working_path + project_dir +  image_dir + "/user_positions")
-                    # Get_positions for this user in this image: using paging (maxperpage) and using start/end timestamps
-                    pos_success = False
-                    while (not pos_success):
-                        # Retry if we got error
-                        try:
-                            positions = conn.get_positions(id_image=id_image,
-                                                           id_user=id_user,
-                                                           maxperpage=maxperpage,
-                                                           afterthan=start_timestamp,
-                                                           beforethan=end_timestamp,
-                                                           showDetails=True)
-                            pos_success = True
-                        except socket.error:
-                            print socket.error
-                            time.sleep(1)
-                            continue
-                        except socket.timeout:
-                            print socket.timeout
-                            time.sleep(1)
-                            continue
-                        except ValueError:
-                            print socket.timeout
-                            time.sleep(1)
-                            continue
-                        except Exception:
-                            time.sleep(1)
-                            continue
-
-                    nb_positions = len(positions.data())
-                    nb_opens = 0
-                    if nb_positions == 0:
-                        fstats.flush()
-                    elif nb_positions > 0:
-                        csv_filename = str(id_user) + "_" + str(u.username) + '_cytomine_positions.csv'
-                        #create output csv file to store positions
-                        output_position_file = os.path.join(working_path + project_dir + image_dir + "/user_positions" , csv_filename)
-                        f = open(output_position_file, "wb")
-                        csvout = csv.writer(f)
-
-                        #Create vector for distribution of zoom levels
-                        #Create vector for distribution of days (end_time - start_time)
-                        nb_time_intervals = int(math.ceil((end_timestamp-start_timestamp)/timestep))/1000
-                        time_intervals = np.zeros(nb_time_intervals+1)
-                        central_positions = np.zeros(nb_time_intervals+1)
-
-                        #Filter obtained positions based on start/end timestamp (only write in csv positions included in the given time interval)
-                        #Save every position in a csv file
-                        previous_central=float(start_timestamp)
-                        csvout.writerow(['corners', 'center', 'zoom', 'created'])
-                        for p in positions.data():
-                            if float(p.created) > float(start_timestamp) and float(p.created) < float(end_timestamp):
-
-                                in_timeinterval = int(math.floor((float(p.created) - float(start_timestamp)) / timestep)) / 1000
-                                geom = loads(p.location)
-                                if (p.x != image_instance.width / 2) and (p.y != image_instance.height / 2):
-                                    rescaled_corners = list(geom.exterior.coords)
-                                    rescaled_corners.pop()
-                                    rescaled_corners = [tuple(map(lambda divide : round(divide / rescale_factor), corner)) for corner in rescaled_corners]
-                                    #csvout.writerow([list(geom.exterior.coords),(int(round(p.x / rescale_factor)), int(round(p.y / rescale_factor))), int(p.zoom), float(p.created)])
-                                    csvout.writerow([rescaled_corners, (round(geom.centroid.x / rescale_factor), round(geom.centroid.y / rescale_factor)), int(p.zoom), float(p.created)])
-                                    zooms[p.zoom - 1] += 1
-                                    time_intervals[in_timeinterval] += 1
-                                else:
-                                    central_positions[in_timeinterval] += 1
-                                    if float(p.created) - previous_central > opening_delay:  # if > 10s we assume user opens the image again
-                                        nb_opens += 1
-                                    previous_central = float(p.created)
-                            else:
-                                print "Point removed because not in the timeframe"  # should not happen
-
-                        f.close()
-
-                    #Get Annotations
-                    #Get user annotations in this image (to generate statistics about annotation creation).
-                    nb_filtered_annotations=0
-                    annotations = conn.get_annotations(id_image=id_image,
-                                                       id_user=id_user,
-                                                       id_project=id_project)
-                    nb_annotations = len(annotations.data())
-                    csv_filename = str(id_user) + "_" + str(u.username) + '_cytomine_annotations.csv'
-                    if not os.path.exists(working_path + project_dir + image_dir + "/user_annotations"):
-                        os.makedirs(working_path + project_dir + image_dir + "/user_annotations")
-                    if nb_annotations > 0:
-                        print "We actually have at least 1 annotation"
-                        output_annotation_file = os.path.join(working_path + project_dir + image_dir + "/user_annotations", csv_filename)
-                        f = open(output_annotation_file, "wb")
-                        csv_annotations = csv.writer(f)
-                        csv_annotations.writerow(['type', 'x_center', 'y_center', 'annotationIdent'])
-                        for a in annotations.data():
-                            if float(a.created) > float(start_timestamp) and float(a.created) < float(end_timestamp):
-                                geom = loads(a.location)
-                                nb_filtered_annotations += 1
-                                if geom.type == 'Point':
-                                    csv_annotations.writerow([geom.type,geom.x,geom.y,a.id])
-                                else:
-                                    csv_annotations.writerow([geom.type, geom.centroid.x, geom.centroid.y,a.id])
-                        f.close()
-
-                    #Get AnnotationActions
-                    if not os.path.exists(working_path + project_dir + image_dir + "/user_actions"):
-                        os.makedirs(working_path + project_dir + image_dir + "/user_actions")
-                    pos_success = False
-                    while (not pos_success):
-                        # Retry if we got error
-                        try:
-                            ann_actions = conn.get_annoationactions(id_image=id_image,
-                                                           id_user=id_user,
-                                                           maxperpage=maxperpage,
-                                                           afterthan=start_timestamp,
-                                                           beforethan=end_timestamp,
-                                                           showDetails=True)
-                            pos_success = True
-                        except socket.error:
-                            print socket.error
-                            time.sleep(1)
-                            continue
-                        except socket.timeout:
-                            print socket.timeout
-                            time.sleep(1)
-                            continue
-                        except ValueError:
-                            print socket.timeout
-                            time.sleep(1)
-                            continue
-                        except Exception:
-                            time.sleep(1)
-                            continue
-                    nb_actions = len(ann_actions.data())
-                    if nb_actions == 0:
-                        fstats.flush()
-                    elif nb_actions > 0:
-                        csv_filename = str(id_user) + "_" + str(u.username) + '_cytomine_actions.csv'
-                        #create output csv file to store actions
-                        output_action_file = os.path.join(working_path + project_dir + image_dir + "/user_actions" , csv_filename)
-                        f = open(output_action_file, "wb")
-                        csvout = csv.writer(f)
-
-                        #Create vector for distribution of zoom levels
-                        #Create vector for distribution of days (end_time - start_time)
-                        nb_time_intervals = int(math.ceil((end_timestamp-start_timestamp)/timestep))/1000
-                        time_intervals = np.zeros(nb_time_intervals+1)
-                        central_positions = np.zeros(nb_time_intervals+1)
-
-                        #Filter obtained positions based on start/end timestamp (only write in csv positions included in the given time interval)
-                        #Save every position in a csv file
-                        previous_central=float(start_timestamp)
-                        csvout.writerow(['annotationIdent', 'created', 'action'])
-                        for a in ann_actions.data():
-                            if float(a.created) > float(start_timestamp) and float(a.created) < float(end_timestamp):
-                                csvout.writerow([a.annotationIdent, a.created, a.action])
-                        f.close()
-
-
-                    csvoutstats.writerow(
-                        [id_project, id_image, id_user, u.username, u.email, nb_annotations, nb_opens, sum(zooms), zooms,
-                         nb_ref_annotations])
+def csv_size(rows):
+    """
+    :param rows: csv rows
+    :return: number of bytes the rows take in a csv file
+    """
+    out = StringIO.StringIO()
+    csvout = csv.writer(out)
+    for row in rows:
+        csvout.writerow(row)
+    return len(out.getvalue())
+
+
+def count_pages(nb_rows, maxperpage):
+    """
+    :param nb_rows: number of rows of a paged request
+    :param maxperpage: size of the pages
+    :return: number of requests to get the rows (an empty response is still a request)
+    """
+    return max(1, int(math.ceil(nb_rows / float(maxperpage))))
+
+
+def sample_pair(conn, run, image_info, u):
+    """
+    Fetches the data of one (image, user) pair in memory to measure it, nothing is written
+    :param conn: Cytomine connection
+    :param run: run settings
+    :param image_info: dictionary with the 'id_image', 'width', 'height', 'depth' and 'rescale_factor' keys
+    :param u: cytomine user
+    :return: dictionary endpoint -> (nb of objects fetched, nb of bytes of the csv rows)
+    """
+    pages = fetch_positions(conn, run, image_info, u.id, run['start_timestamp'])
+    rows = []
+    for page in pages:
+        rows += parse_position_page(run, image_info, run['start_timestamp'], page)['rows']
+    measures = {'positions': (sum(len(page) for page in pages), csv_size(rows))}
+
+    annotations = run['retry'].call("get_annotations", no_empty_response(conn.get_annotations),
+                                    id_image=image_info['id_image'],
+                                    id_user=u.id,
+                                    id_project=run['id_project']).data()
+    measures['annotations'] = (len(annotations), csv_size(parse_annotations(run, annotations)['rows']))
+
+    ann_actions = run['retry'].call("get_annoationactions", no_empty_response(conn.get_annoationactions),
+                                    id_image=image_info['id_image'],
+                                    id_user=u.id,
+                                    maxperpage=run['maxperpage'],
+                                    afterthan=run['start_timestamp'],
+                                    beforethan=run['end_timestamp'],
+                                    showDetails=True).data()
+    measures['actions'] = (len(ann_actions), csv_size(parse_actions(run, run['start_timestamp'], ann_actions)['rows']))
+    return measures
+
+
+def plan_project(project_dir, id_project, users_metadata_file, id_ref_user, im_subset=None, us_subset=None,
+                 cytomine_host=config.cytomine_host, cytomine_public_key=config.cytomine_public_key,
+                 cytomine_private_key=config.cytomine_private_key, workers=config.DOWNLOAD_WORKERS, resume=False,
+                 sample=config.PLAN_SAMPLE_PAIRS):
+    """
+    Dry run of get_data : lists the images and users that would be downloaded, and estimates the number of requests,
+    the volume and the duration of the download. Nothing is written.
+    Units of a previous download (manifest.csv or csv files on disk) are measured from their files, a few of the
+    other pairs are fetched in memory and their average is used for the rest.
+    See get_data for the parameters.
+    :param resume: optional, the units completed by a previous run are not counted (see manifest.csv)
+    :param sample: optional, number of (image, user) pairs fetched to measure the pairs not on disk
+    :return: dictionary of the estimates
+    """
+    conn = get_connection(cytomine_host, cytomine_public_key, cytomine_private_key)
+    telemetry = Download_telemetry(0)
+    retry = Retry_policy(telemetry=telemetry, limiter=Rate_limiter())
+    rescaled_size = 1024
+    maxperpage = 500  # unamur
+    if '/' not in project_dir:
+        project_dir = project_dir + "/"
+    project_path = config.WORKING_DIRECTORY + project_dir
+    run = {'id_project': id_project,
+           'start_timestamp': to_timestamp(config.start_time),
+           'end_timestamp': to_timestamp(config.end_time),
+           'maxperpage': maxperpage,
+           'retry': retry,
+           'stream': False}
+
+    # same selection of images and users as get_data
+    id_users = retry.call("get_project_users", no_empty_response(conn.get_project_users), id_project)
+    image_instances = ImageInstanceCollection()
+    image_instances.project = id_project
+    image_instances = retry.call("fetch_image_instances", no_empty_response(conn.fetch), image_instances)
+    userlist = read_userlist(users_metadata_file)
+    images = [image for image in image_instances.data() if im_subset is None or image.id in im_subset]
+    users = [u for u in id_users.data() if u.id in userlist and (us_subset is None or u.id in us_subset)]
+    print "Images (%d) :" % len(images)
+    for image in images:
+        print "  %d" % image.id
+    print "Users (%d) :" % len(users)
+    for u in users:
+        print "  %d %s" % (u.id, u.username)
+
+    manifest = Download_manifest(os.path.join(project_path, 'manifest.csv'), read_only=True)
+    properties = Property_cache(os.path.join(project_path, 'annotation_properties.csv'))
+    endpoints = ['positions', 'annotations', 'actions']
+
+    # image level : image instance, thumbnail, reference annotations and their properties
+    image_requests = 0
+    nb_bytes = 0
+    nb_ref_annotations = 0
+    for image in images:
+        image_path = project_path + "images/image_" + str(image.id)
+        image_requests += 1
+        if os.path.exists(image_path + "/image.png"):
+            nb_bytes += os.path.getsize(image_path + "/image.png")
+        else:
+            image_requests += 1
+        ref_file = os.path.join(image_path + "/", 'reference_cytomine_annotations.csv')
+        ref = manifest.get(image.id, "", 'reference', ref_file)
+        if ref is not None:
+            nb_ref_annotations += ref['nb_rows']
+        if ref is None or not resume:
+            image_requests += 1
+    image_requests += max(0, nb_ref_annotations - len(properties.values))
+
+    # pair level : units on disk are measured, the others are extrapolated from a sample
+    measured = dict((endpoint, []) for endpoint in endpoints)
+    unknown = dict((endpoint, 0) for endpoint in endpoints)
+    unknown_pairs = []
+    nb_skipped = 0
+    pair_requests = 0
+    for image in images:
+        image_path = project_path + "images/image_" + str(image.id)
+        for u in users:
+            files = pair_files({'image_path': image_path}, u)
+            missing = False
+            for endpoint in endpoints:
+                unit = manifest.get(image.id, u.id, endpoint, files[endpoint])
+                if unit is not None and resume:
+                    nb_skipped += 1
+                elif unit is not None or os.path.exists(files[endpoint]):
+                    nb_rows = unit['nb_rows'] if unit is not None else max(0, count_lines(files[endpoint]) - 1)
+                    size = os.path.getsize(files[endpoint]) if os.path.exists(files[endpoint]) else 0
+                    measured[endpoint].append((nb_rows, size))
+                    pair_requests += count_pages(nb_rows, maxperpage) if endpoint != 'annotations' else 1
+                    nb_bytes += size
+                else:
+                    unknown[endpoint] += 1
+                    missing = True
+            if missing:
+                unknown_pairs.append((image, u))
+
+    nb_sampled = 0
+    if len(unknown_pairs) > 0 and sample > 0:
+        image_infos = {}
+        for image, u in unknown_pairs[::max(1, len(unknown_pairs) / sample)][:sample]:
+            if image.id not in image_infos:
+                image_instance = retry.call("get_image_instance", no_empty_response(conn.get_image_instance), image.id)
+                image_infos[image.id] = {'id_image': image.id,
+                                         'width': image_instance.width,
+                                         'height': image_instance.height,
+                                         'depth': image_instance.depth,
+                                         'rescale_factor': get_rescale_factor(image_instance, rescaled_size)}
+            measures = sample_pair(conn, run, image_infos[image.id], u)
+            for endpoint in endpoints:
+                measured[endpoint].append(measures[endpoint])
+            nb_sampled += 1
+
+    nb_extrapolated = 0
+    for endpoint in endpoints:
+        if unknown[endpoint] == 0 or len(measured[endpoint]) == 0:
+            continue
+        if endpoint != 'annotations':
+            mean_pages = np.mean([count_pages(m[0], maxperpage) for m in measured[endpoint]])
+        else:
+            mean_pages = 1
+        mean_size = np.mean([m[1] for m in measured[endpoint]])
+        pair_requests += int(round(unknown[endpoint] * mean_pages))
+        nb_bytes += unknown[endpoint] * mean_size
+        nb_extrapolated += unknown[endpoint]
+
+    # mean latency of a previous download if there is one, otherwise of the requests of this plan
+    latency_file = os.path.join(project_path, 'telemetry.json')
+    latency_source = "previous download"
+    endpoints_telemetry = {}
+    if os.path.exists(latency_file):
+        f = open(latency_file, "rb")
+        endpoints_telemetry = json.load(f)['endpoints']
+        f.close()
+    if len(endpoints_telemetry) == 0:
+        endpoints_telemetry = telemetry.to_dict()['endpoints']
+        latency_source = "plan requests"
+    latency = sum(e['latency_total'] for e in endpoints_telemetry.values()) / \
+              max(1, sum(e['requests'] for e in endpoints_telemetry.values()))
+
+    # images are prepared one at a time, the pairs by the workers, both bounded by the rate limit
+    image_duration = max(image_requests * latency, image_requests / float(config.RATE_LIMIT_MAX_RATE))
+    pair_duration = max(pair_requests * latency / max(1, workers), pair_requests / float(config.RATE_LIMIT_MAX_RATE))
+    duration = image_duration + pair_duration
+
+    nb_pairs = len(images) * len(users)
+    print "Plan for project %s (%d) : %d images, %d users, %d (image, user) pairs" % (project_dir, id_project,
+                                                                                     len(images), len(users), nb_pairs)
+    print "  units measured on disk %d, pairs sampled %d, units extrapolated %d, units skipped (resume) %d" % (
+        sum(len(m) for m in measured.values()) - nb_sampled * len(endpoints), nb_sampled, nb_extrapolated, nb_skipped)
+    print "  requests : %d (%d image level, %d pair level)" % (image_requests + pair_requests, image_requests,
+                                                             pair_requests)
+    print "  volume : %.1f MB" % (nb_bytes / 1024.0 / 1024.0)
+    print "  mean latency : %.3fs (%s)" % (latency, latency_source)
+    print "  projected duration with %d workers : %dh%02dm%02ds" % (workers, duration / 3600, duration % 3600 / 60,
+                                                                    duration % 60)
+
+    return {'nb_images': len(images),
+            'nb_users': len(users),
+            'nb_pairs': nb_pairs,
+            'image_requests': image_requests,
+            'pair_requests': pair_requests,
+            'bytes': nb_bytes,
+            'latency': latency,
+            'workers': workers,
+            'duration': duration}
 
 
 def handle_args(args):
@@ -383,6 +1472,14 @@ def handle_args(args):
     images = False
     image_info = None
     modules = None
+    workers = config.DOWNLOAD_WORKERS
+    resume = False
+    sync = False
+    stream = config.STREAM_POSITIONS
+    parsers = config.PARSE_WORKERS
+    plan = False
+    skip_inactive = config.SKIP_INACTIVE_PAIRS
+    store = config.IMAGE_STORE
     try:
         name = str(args[1])
         id_proj = int(args[2])
@@ -411,6 +1508,30 @@ def handle_args(args):
             elif args[i] == "-M" and (i + 1) < len(args):
                 modules = str(args[i + 1])
                 i += 2
+            elif args[i] == "-W" and (i + 1) < len(args):
+                workers = int(args[i + 1])
+                i += 2
+            elif args[i] == "-WP" and (i + 1) < len(args):
+                parsers = int(args[i + 1])
+                i += 2
+            elif args[i] == "--resume":
+                resume = True
+                i += 1
+            elif args[i] == "--sync":
+                sync = True
+                i += 1
+            elif args[i] == "--stream":
+                stream = True
+                i += 1
+            elif args[i] == "--store":
+                store = True
+                i += 1
+            elif args[i] == "--all-pairs":
+                skip_inactive = False
+                i += 1
+            elif args[i] == "--plan":
+                plan = True
+                i += 1
 
     except:
         error_msg()
@@ -436,8 +1557,16 @@ def handle_args(args):
             user_list.append(str(u_tmp[0]))
         f_user_list.close()
 
+    if plan:
+        plan_project(name, id_proj, users_files, ref_user, im_subset=image_list, us_subset=user_list,
+                     cytomine_host=host, cytomine_private_key=priv_key, cytomine_public_key=pub_key, workers=workers,
+                     resume=resume)
+        return
+
     get_data(name, id_proj, users_files, ref_user, im_subset=image_list, us_subset=user_list, cytomine_host=host, cytomine_private_key=priv_key,
-             cytomine_public_key=pub_key, modules=modules)
+             cytomine_public_key=pub_key, modules=modules, workers=workers,
+             resume=resume, sync=sync, stream=stream, parsers=parsers, skip_inactive=skip_inactive,
+             store=store)
 
 
 
@@ -455,6 +1584,14 @@ def error_msg():
     print "  -I <image_id_file_dir> :\n    CSV file with image IDs, Default takes all images in the project\n    Gets data on the subset of images\n"
     print "  -U <user_id file_dir> :\n    CSV file with user IDs, Default takes all the users in the users metadata file\n    Gets data on the subset of users\n"
     print "  -/m <module file_dir> :\n    CSV file with moduless, Default no modules\n    copies this file\n"
+    print "  -W <nb_workers> :\n    Number of (image, user) pairs downloaded concurrently, Default config.DOWNLOAD_WORKERS\n"
+    print "  -WP <nb_parsers> :\n    Number of threads turning the fetched data into rows, Default config.PARSE_WORKERS\n"
+    print "  --resume :\n    Resumes an interrupted download, units listed in manifest.csv whose files are intact are not fetched again\n"
+    print "  --sync :\n    Refreshes a previous download, only fetches the positions and actions newer than the ones already stored\n"
+    print "  --stream :\n    Fetches and writes the positions one page at a time, memory stays flat for very active users\n"
+    print "  --store :\n    Also packs the positions, annotations and actions of each image in one file, loaded faster by Image_data (see image_store.py)\n"
+    print "  --all-pairs :\n    Fetches every (image, user) pair, Default only the pairs with image consultations in the time range\n"
+    print "  --plan :\n    Dry run, lists the images and users and estimates the requests, volume and duration of the download\n    (with the -W workers, and without the units already done if --resume)\n"
 
 
 if __name__ == '__main__':
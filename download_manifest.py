@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+
+#
+# * Copyright (c) 2009-2017. Authors: see NOTICE file.
+# *
+# * Licensed under the Apache License, Version 2.0 (the "License");
+# * you may not use this file except in compliance with the License.
+# * You may obtain a copy of the License at
+# *
+# *      http://www.apache.org/licenses/LICENSE-2.0
+# *
+# * Unless required by applicable law or agreed to in writing, software
+# * distributed under the License is distributed on an "AS IS" BASIS,
+# * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# * See the License for the specific language governing permissions and
+# * limitations under the License.
+# */
+
+
+__author__          = "Vanhee Laurent <laurent.vanhee@student.uliege.ac.be>"
+__copyright__       = "Copyright 2010-2017 University of Liège, Belgium, http://www.cytomine.be/"
+
+
+import csv
+import hashlib
+import json
+import os
+import threading
+import config
+
+
+def file_checksum(filename):
+    """
+    md5 checksum of a file
+    :param filename: file to hash
+    :return: hex digest ("" if the file does not exist)
+    """
+    if not os.path.exists(filename):
+        return ""
+    md5 = hashlib.md5()
+    f = open(filename, "rb")
+    for block in iter(lambda: f.read(1 << 20), b""):
+        md5.update(block)
+    f.close()
+    return md5.hexdigest()
+
+
+class Download_manifest:
+    """
+    Keeps track of every completed (image, user, endpoint) unit of a download, so that
+    an interrupted download can be resumed without fetching the finished units again.
+    Each unit is appended to the manifest file as soon as it is completed, and the file is synced to disk every
+    few units : a resumed download checks the output files again, a unit lost on a crash is only fetched again.
+    """
+    HEADER = ['id_image', 'id_user', 'endpoint', 'nb_rows', 'checksum', 'summary']
+
+    def __init__(self, filename, resume=False, read_only=False, sync_every=config.MANIFEST_SYNC_EVERY):
+        """
+        Inits the object
+        :param filename: manifest file (<project>/manifest.csv)
+        :param resume: keep the units of a previous run, otherwise the manifest is started over
+        :param read_only: only loads the units of a previous run (implies resume), nothing can be added
+        :param sync_every: number of units between 2 syncs of the file to disk (it is synced on close too)
+        """
+        self.filename = filename
+        self.units = {}
+        self.sync_every = max(1, sync_every)
+        self.nb_unsynced = 0
+        self.lock = threading.Lock()
+
+        self.f = None
+        if (resume or read_only) and os.path.exists(filename):
+            f = open(filename, "rb")
+            csv_in = csv.reader(f)
+            data = list(csv_in)
+            f.close()
+            for row in data[1:]:
+                # last line can be truncated if the previous run was killed while writing it
+                if len(row) == len(self.HEADER):
+                    self.units[(row[0], row[1], row[2])] = {'nb_rows': int(row[3]),
+                                                            'checksum': row[4],
+                                                            'summary': json.loads(row[5])}
+            if not read_only:
+                self.f = open(filename, "ab")
+                self.csvout = csv.writer(self.f)
+        elif not read_only:
+            self.f = open(filename, "wb")
+            self.csvout = csv.writer(self.f)
+            self.csvout.writerow(self.HEADER)
+            self.f.flush()
+
+    def add(self, id_image, id_user, endpoint, filename, nb_rows, summary=None):
+        """
+        Records a completed unit, filename should already be complete on disk
+        :param id_image: image id
+        :param id_user: user id ("" for image level units)
+        :param endpoint: positions, annotations, actions, reference, ...
+        :param filename: output file of the unit (may not exist if nothing was written)
+        :param nb_rows: number of rows written
+        :param summary: optional dictionary of values needed to rebuild stats without the data
+        :return: None
+        """
+        if summary is None:
+            summary = {}
+        checksum = file_checksum(filename)
+        key = (str(id_image), str(id_user), endpoint)
+        with self.lock:
+            self.units[key] = {'nb_rows': nb_rows, 'checksum': checksum, 'summary': summary}
+            self.csvout.writerow([key[0], key[1], endpoint, nb_rows, checksum, json.dumps(summary)])
+            self.f.flush()
+            self.nb_unsynced += 1
+            if self.nb_unsynced >= self.sync_every:
+                os.fsync(self.f.fileno())
+                self.nb_unsynced = 0
+
+    def get(self, id_image, id_user, endpoint, filename):
+        """
+        Gets a completed unit if its output file is still the one that was recorded
+        :param id_image: image id
+        :param id_user: user id ("" for image level units)
+        :param endpoint: endpoint name
+        :param filename: output file of the unit
+        :return: dictionary with 'nb_rows', 'checksum' and 'summary' keys, None if the unit has to be (re)done
+        """
+        with self.lock:
+            unit = self.units.get((str(id_image), str(id_user), endpoint))
+        if unit is None or file_checksum(filename) != unit['checksum']:
+            return None
+        return unit
+
+    def close(self):
+        """
+        Syncs and closes the manifest file
+        :return: None
+        """
+        if self.f is not None:
+            with self.lock:
+                self.f.flush()
+                os.fsync(self.f.fileno())
+                self.f.close()
+                self.f = None
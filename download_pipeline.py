@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+
+#
+# * Copyright (c) 2009-2017. Authors: see NOTICE file.
+# *
+# * Licensed under the Apache License, Version 2.0 (the "License");
+# * you may not use this file except in compliance with the License.
+# * You may obtain a copy of the License at
+# *
+# *      http://www.apache.org/licenses/LICENSE-2.0
+# *
+# * Unless required by applicable law or agreed to in writing, software
+# * distributed under the License is distributed on an "AS IS" BASIS,
+# * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# * See the License for the specific language governing permissions and
+# * limitations under the License.
+# */
+
+
+__author__          = "Vanhee Laurent <laurent.vanhee@student.uliege.ac.be>"
+__copyright__       = "Copyright 2010-2017 University of Liège, Belgium, http://www.cytomine.be/"
+
+
+import Queue
+import threading
+import time
+import traceback
+import config
+
+
+# put on a stage queue once per worker to stop it
+STOP = object()
+
+
+class Pipeline_stage:
+    """
+    One stage of a Download_pipeline : a pool of threads taking items from a bounded queue, and putting
+    what they produce on the queue of the next stage. A full queue blocks the previous stage, so a slow
+    stage slows the others down instead of piling up data in memory.
+    """
+    def __init__(self, name, func, nb_workers, queue_size, on_error=None):
+        """
+        Inits the object
+        :param name: stage name, used in the reports
+        :param func: function of an item returning an iterable of items for the next stage (or None)
+        :param nb_workers: number of threads of the stage
+        :param queue_size: maximum number of items waiting in front of the stage
+        :param on_error: optional, function of (item, exception, number of items already passed on for it) returning
+                the items passed on instead of the rest of the outputs of a failed item (or None)
+        """
+        self.name = name
+        self.func = func
+        self.on_error = on_error
+        self.nb_workers = nb_workers
+        self.queue = Queue.Queue(queue_size)
+        self.next = None
+        self.threads = []
+        self.items = 0
+        self.busy = 0.0
+        self.blocked = 0.0
+        self.idle = 0.0
+        self.depth_total = 0
+        self.depth_max = 0
+        self.errors = []
+        self.handled = 0
+        self.lock = threading.Lock()
+
+    def start(self):
+        for i in range(self.nb_workers):
+            thread = threading.Thread(target=self.run, name="%s-%d" % (self.name, i))
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+
+    def run(self):
+        while True:
+            start = time.time()
+            item = self.queue.get()
+            idle = time.time() - start
+            if item is STOP:
+                return
+            depth = self.queue.qsize()
+            blocked = 0.0
+            nb_outputs = 0
+            start = time.time()
+            try:
+                outputs = self.func(item)
+                if outputs is not None:
+                    for output in outputs:
+                        start_put = time.time()
+                        self.next.queue.put(output)
+                        blocked += time.time() - start_put
+                        nb_outputs += 1
+            except Exception as e:
+                # the stage keeps consuming so the others are not blocked, the next stages get the replacement
+                # items of on_error (EG the end of a unit of work they wait for). An error handled by on_error
+                # only fails its item, the others are raised by Download_pipeline.join.
+                traceback.print_exc()
+                if self.on_error is None:
+                    with self.lock:
+                        self.errors.append(e)
+                else:
+                    try:
+                        outputs = self.on_error(item, e, nb_outputs)
+                        if outputs is not None:
+                            for output in outputs:
+                                self.next.queue.put(output)
+                        with self.lock:
+                            self.handled += 1
+                    except Exception as e:
+                        traceback.print_exc()
+                        with self.lock:
+                            self.errors.append(e)
+            with self.lock:
+                self.items += 1
+                self.busy += time.time() - start - blocked
+                self.blocked += blocked
+                self.idle += idle
+                self.depth_total += depth
+                self.depth_max = max(self.depth_max, depth)
+
+    def stop(self):
+        """
+        Lets the workers process what is left in the queue, then stops them
+        :return: None
+        """
+        for thread in self.threads:
+            self.queue.put(STOP)
+        for thread in self.threads:
+            thread.join()
+
+    def to_dict(self):
+        """
+        :return: dictionary of the stage metrics, times in seconds summed over the workers
+        """
+        with self.lock:
+            return {'workers': self.nb_workers,
+                    'items': self.items,
+                    'busy': self.busy,
+                    'blocked': self.blocked,
+                    'idle': self.idle,
+                    'queue_depth_mean': self.depth_total / float(max(self.items, 1)),
+                    'queue_depth_max': self.depth_max,
+                    'errors': len(self.errors),
+                    'failed_items': self.handled}
+
+
+class Download_pipeline:
+    """
+    Chain of Pipeline_stage : items put in the pipeline go through every stage in order, each stage
+    having its own number of workers. Reports the depth of every queue and the time each stage spends
+    working (busy), waiting for input (idle) and waiting for room in the next queue (blocked).
+    """
+    def __init__(self, queue_size=config.PIPELINE_QUEUE_SIZE):
+        """
+        Inits the object
+        :param queue_size: maximum number of items waiting in front of each stage
+        """
+        self.queue_size = queue_size
+        self.stages = []
+
+    def add_stage(self, name, func, nb_workers=1, on_error=None):
+        """
+        Appends a stage to the pipeline
+        :param name: stage name
+        :param func: function of an item returning an iterable of items for the next stage (None for the last stage)
+        :param nb_workers: number of threads of the stage
+        :param on_error: optional, function of (item, exception, number of items already passed on for it) returning
+                the items passed on in place of a failed item (see Pipeline_stage)
+        :return: None
+        """
+        stage = Pipeline_stage(name, func, max(1, nb_workers), self.queue_size, on_error)
+        if len(self.stages) > 0:
+            self.stages[-1].next = stage
+        self.stages.append(stage)
+
+    def start(self):
+        for stage in self.stages:
+            stage.start()
+
+    def put(self, item):
+        """
+        Feeds the first stage, blocks while its queue is full
+        :param item: input item of the first stage
+        :return: None
+        """
+        self.stages[0].queue.put(item)
+
+    def join(self):
+        """
+        Waits until every item went through every stage, and stops the workers.
+        Raises the first error of a stage that was not handled by its on_error function, if there was one.
+        :return: None
+        """
+        for stage in self.stages:
+            stage.stop()
+        for stage in self.stages:
+            if len(stage.errors) > 0:
+                raise stage.errors[0]
+
+    def summary(self):
+        """
+        One line summary of the queue depths
+        :return: string
+        """
+        return ", ".join("%s queue %d/%d" % (stage.name, stage.queue.qsize(), self.queue_size)
+                         for stage in self.stages)
+
+    def to_dict(self):
+        return dict((stage.name, stage.to_dict()) for stage in self.stages)
+
+    def report(self):
+        """
+        Multi line report of the stage metrics
+        :return: string
+        """
+        lines = []
+        for stage in self.stages:
+            s = stage.to_dict()
+            lines.append("%s : %d workers, %d items, busy %.1fs, idle %.1fs, blocked %.1fs, queue depth mean %.1f max %d"
+                         % (stage.name, s['workers'], s['items'], s['busy'], s['idle'], s['blocked'],
+                            s['queue_depth_mean'], s['queue_depth_max']))
+        return "\n".join(lines)
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+
+#
+# * Copyright (c) 2009-2017. Authors: see NOTICE file.
+# *
+# * Licensed under the Apache License, Version 2.0 (the "License");
+# * you may not use this file except in compliance with the License.
+# * You may obtain a copy of the License at
+# *
+# *      http://www.apache.org/licenses/LICENSE-2.0
+# *
+# * Unless required by applicable law or agreed to in writing, software
+# * distributed under the License is distributed on an "AS IS" BASIS,
+# * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# * See the License for the specific language governing permissions and
+# * limitations under the License.
+# */
+
+
+__author__          = "Vanhee Laurent <laurent.vanhee@student.uliege.ac.be>"
+__copyright__       = "Copyright 2010-2017 University of Liège, Belgium, http://www.cytomine.be/"
+
+
+import json
+import threading
+import time
+import numpy as np
+import config
+
+
+class Download_telemetry:
+    """
+    Counters of a download : requests, latencies, retries and errors per endpoint, rows and bytes written
+    per output, and progress over the (image, user) pairs. The Cytomine client does not expose the size
+    of the responses, so the volume is measured on the files written.
+    """
+    def __init__(self, interval=config.TELEMETRY_INTERVAL):
+        """
+        Inits the object
+        :param interval: seconds between 2 console summaries (0 to disable them)
+        """
+        self.interval = interval
+        self.start_time = time.time()
+        self.latencies = {}
+        self.errors = {}
+        self.retries = {}
+        self.rows = {}
+        self.bytes = {}
+        self.nb_pairs = 0
+        self.pairs_done = 0
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = None
+        self.pipeline = None
+
+    def record_call(self, endpoint, seconds, success):
+        """
+        Records one request (one attempt of a call)
+        :param endpoint: endpoint name
+        :param seconds: duration of the request
+        :param success: whether the request succeeded
+        :return: None
+        """
+        with self.lock:
+            self.latencies.setdefault(endpoint, []).append(seconds)
+            if not success:
+                self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+
+    def record_retry(self, endpoint):
+        with self.lock:
+            self.retries[endpoint] = self.retries.get(endpoint, 0) + 1
+
+    def record_rows(self, output, nb_rows, nb_bytes):
+        """
+        Records data written to disk
+        :param output: kind of output (positions, annotations, actions, reference)
+        :param nb_rows: number of rows written
+        :param nb_bytes: size of the output file
+        :return: None
+        """
+        with self.lock:
+            self.rows[output] = self.rows.get(output, 0) + nb_rows
+            self.bytes[output] = self.bytes.get(output, 0) + nb_bytes
+
+    def pair_done(self):
+        with self.lock:
+            self.pairs_done += 1
+
+    def start(self, nb_pairs, pipeline=None):
+        """
+        Starts the periodic console summary
+        :param nb_pairs: total number of (image, user) pairs to download
+        :param pipeline: optional, Download_pipeline whose queues and stages are reported
+        :return: None
+        """
+        self.nb_pairs = nb_pairs
+        self.pipeline = pipeline
+        self.start_time = time.time()
+        if self.interval > 0:
+            self.thread = threading.Thread(target=self.run)
+            self.thread.daemon = True
+            self.thread.start()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            print self.summary()
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+
+    def summary(self):
+        """
+        One line progress summary (pairs, throughput, ETA)
+        :return: string
+        """
+        with self.lock:
+            elapsed = time.time() - self.start_time
+            nb_requests = sum(len(l) for l in self.latencies.values())
+            nb_bytes = sum(self.bytes.values())
+            pairs_done = self.pairs_done
+        pairs_s = pairs_done / elapsed if elapsed > 0 else 0.0
+        if pairs_s > 0:
+            eta = "%ds" % ((self.nb_pairs - pairs_done) / pairs_s)
+        else:
+            eta = "?"
+        summary = "%d/%d pairs, %.2f pairs/s, %.1f requests/s, %.1f KB/s written, ETA %s" % (
+            pairs_done, self.nb_pairs, pairs_s, nb_requests / max(elapsed, 1e-6), nb_bytes / 1024.0 / max(elapsed, 1e-6),
+            eta)
+        if self.pipeline is not None:
+            summary += " (%s)" % self.pipeline.summary()
+        return summary
+
+    def to_dict(self):
+        """
+        :return: dictionary with every counter, per endpoint for the requests, per output for the data
+                 written and per pipeline stage, latency percentiles in seconds
+        """
+        with self.lock:
+            elapsed = time.time() - self.start_time
+            endpoints = {}
+            for endpoint in self.latencies:
+                latencies = np.array(self.latencies[endpoint])
+                e = {'requests': len(latencies),
+                     'errors': self.errors.get(endpoint, 0),
+                     'retries': self.retries.get(endpoint, 0),
+                     'latency_total': float(np.sum(latencies)),
+                     'latency_max': float(np.max(latencies))}
+                for p in [50, 90, 95, 99]:
+                    e['latency_p%d' % p] = float(np.percentile(latencies, p))
+                endpoints[endpoint] = e
+            outputs = {}
+            for output in self.rows:
+                outputs[output] = {'rows': self.rows[output], 'bytes': self.bytes[output]}
+            return {'elapsed': elapsed,
+                    'nb_pairs': self.nb_pairs,
+                    'pairs_done': self.pairs_done,
+                    'endpoints': endpoints,
+                    'outputs': outputs,
+                    'stages': self.pipeline.to_dict() if self.pipeline is not None else {}}
+
+    def write(self, filename):
+        """
+        Saves the counters in a json file
+        :param filename: output file
+        :return: None
+        """
+        f = open(filename, "wb")
+        json.dump(self.to_dict(), f, indent=2, sort_keys=True)
+        f.close()
@@ -34,6 +34,8 @@ from sklearn import cluster
 from pygazeanalyser.gazeplotter import make_heatmap
 import config
 import matplotlib.pyplot as plt
+# field of view of positions from their corners, vectorized over (n, 4, 2) arrays
+from dictionary_data import get_dimensions
 
 COLORS = {"green": ['#8ae234',
                       '#73d216',
@@ -47,24 +49,6 @@ COLORS = {"green": ['#8ae234',
         }
 
 
-def get_dimensions(corners):
-    """
-    Get the dimension of a position based on the distance of its corners.
-    This is used to determine the feild of view of a zoom
-    :param corners: list containing 4 points with (x,y) values
-    :return: (x,y) dimension of the position
-    """
-    x0, y0 = corners[0]
-    x1, y1 = corners[1]
-    x2, y2 = corners[2]
-    x3, y3 = corners[3]
-
-    x = max([abs(x0 - x1), abs(x0 - x2), abs(x0 - x3)])
-    y = max([abs(y0 - y1), abs(y0 - y2), abs(y0 - y3)])
-    return x, y
-
-
-
 def cluster_points(points, duration=20):
     """
     Clusters a set of points for the generation of a scanpath,
@@ -89,7 +73,7 @@ def cluster_points(points, duration=20):
     for i in range(len(points['x'])):
         X[i][0] = points['x'][i]
         X[i][1] = points['y'][i]
-        X[i][2] = points['timestamp'][i]/TIME_VAL
+        X[i][2] = points['timestamp'][i]/float(TIME_VAL)
 
     # apply clustering
     k_means.fit(X)
@@ -25,7 +25,10 @@ import sys
 import csv
 import config
 import user_data
-from dictionary_data import parse_positions, parse_annotations, parse_annotation_actions
+from dictionary_data import parse_positions, parse_annotations, parse_annotation_actions, positions_from_columns, \
+    set_gaussians, time_mask
+from lru_cache import Lazy_mapping
+import image_store
 from gazemap import cluster_points, score_user_on_image, generate_reduced_heatmap
 from pygazeanalyser.gazeplotter import make_heatmap, save_heatmap, draw_raw, draw_scanpath
 from PIL import Image
@@ -39,13 +42,18 @@ class Image_data:
     # class containg data related to 1 particular image
 
 
-    def __init__(self, project_name, image_dir, manager, user_list):
+    def __init__(self, project_name, image_dir, manager, user_list, memory_map=config.MEMORY_MAP_POSITIONS,
+                 max_users=config.IMAGE_DATA_MAX_USERS):
         """
         Creates an Image data object containing image info and position info
         for all the users that have positions in a dictionary. It loads
         :param project_name: gold/silver
         :param image_dir: image_xxxxx
         :param manager: data_manager object (keep link for when needed)
+        :param memory_map: optional, maps the positions of the image store in memory instead of loading them
+                (see image_store.py), used when the store is up to date
+        :param max_users: optional, maximum number of users whose positions (and actions) stay in memory, the least
+                recently used ones are parsed again when needed. Heatmaps are kept apart (see generate_heatmap).
         """
 
         # init all variables
@@ -56,34 +64,20 @@ class Image_data:
         self.annotations_dir = self.image_dir + "user_annotations/"
         self.ref_annotation_dir = self.image_dir + "reference_cytomine_annotations.csv"
         self.annotation_actions_dir = self.image_dir + "user_actions/"
-        self.user_positions = {}
-        self.user_actions = {}
         self.ref_annotations = None
-        self.gaussians = {'zoom_4': None,
-                          'zoom_5': None,
-                          'zoom_6': None,
-                          'zoom_7': None,
-                          'zoom_8': None,
-                          'zoom_9': None,
-                          'zoom_10': None}
         self.image = Image.open(self.image_dir + "image.png")
         self.rescaled_width, self.rescaled_height = self.image.size
         self.user_data = {}
+        # per user heatmaps, kept out of the positions that max_users may drop
+        self.heatmaps = {}
 
-        end = long(1000 * time.mktime(datetime.datetime.strptime(config.exam_time, "%Y-%m-%d %H:%M:%S").timetuple()))
-
-        # load positions to memory
-        u_positions_files = os.listdir(self.positions_dir)
-        for pos in u_positions_files:
-            if user_list is None or pos.split("_")[0] in user_list:
-                f = open(self.positions_dir + pos, 'rb')
-                pos_id = pos.split('_')[0]
-                csv_in = csv.reader(f)
-                data = list(csv_in)
-                data.pop(0)
-                f.close()
-                pos_data = parse_positions(data, self, calc_gauss=True, end_date=end)
-                self.user_positions[pos_id] = pos_data
+        self.end = long(1000 * time.mktime(datetime.datetime.strptime(config.exam_time, "%Y-%m-%d %H:%M:%S").timetuple()))
+
+        # all the user data of the image in one file if it is up to date (see image_store.py), the per user
+        # csv files otherwise. The store keeps the users in the order of the directories.
+        self.store = None
+        if image_store.store_is_current(self.image_dir):
+            self.store = image_store.Image_store(self.image_dir, memory_map=memory_map)
 
         # loads ref annotations to memory
         try:
@@ -98,20 +92,100 @@ class Image_data:
             ann_data = parse_annotations(data)
             self.ref_annotations = ann_data
 
-        # loads annotation actions to memory
-        u_action_files = os.listdir(self.annotation_actions_dir)
-        for pos in u_action_files:
-            if user_list is None or pos.split("_")[0] in user_list:
-                f = open(self.annotation_actions_dir + pos, 'rb')
-                pos_id = pos.split('_')[0]
-                csv_in = csv.reader(f)
-                data = list(csv_in)
-                data.pop(0)
-                f.close()
-                action_data = parse_annotation_actions(data, self.user_positions[pos_id], self.ref_annotations, end_date=end)
-                self.user_actions[pos_id] = action_data
-
-        self.zoom_max = self.max_zoom()
+        # positions and annotation actions of the users, parsed when a user is first accessed
+        # (gaussians and zoom_max, which depend on every user, are computed on first use, see __getattr__)
+        if self.store is not None:
+            position_users = self.store.users('positions')
+            action_users = self.store.users('actions')
+            self.position_files = {}
+            self.action_files = {}
+        else:
+            self.position_files = self.user_files(self.positions_dir)
+            self.action_files = self.user_files(self.annotation_actions_dir)
+            position_users = [pos_id for pos_id, filename in self.position_files]
+            action_users = [pos_id for pos_id, filename in self.action_files]
+            self.position_files = dict(self.position_files)
+            self.action_files = dict(self.action_files)
+        position_users = [pos_id for pos_id in position_users if user_list is None or pos_id in user_list]
+        action_users = [pos_id for pos_id in action_users if user_list is None or pos_id in user_list]
+        self.user_positions = Lazy_mapping(position_users, self.load_positions, max_users)
+        self.user_actions = Lazy_mapping(action_users, self.load_actions, max_users)
+
+    def __getattr__(self, name):
+        """
+        Computes the gaussians and the highest zoom, which depend on every user, on first use. They only need
+        the zoom levels and corners, see zoom_positions.
+        """
+        if name == 'gaussians':
+            self.gaussians = {'zoom_4': None,
+                              'zoom_5': None,
+                              'zoom_6': None,
+                              'zoom_7': None,
+                              'zoom_8': None,
+                              'zoom_9': None,
+                              'zoom_10': None}
+            # same gaussians as an eager load : first position of each zoom, users in the order of the directory
+            for u_id in self.user_positions:
+                if None not in self.gaussians.values():
+                    break
+                pos, rows = self.zoom_positions(u_id)
+                set_gaussians(self, pos, rows)
+            return self.gaussians
+        if name == 'zoom_max':
+            self.zoom_max = self.max_zoom()
+            return self.zoom_max
+        raise AttributeError(name)
+
+    def zoom_positions(self, pos_id):
+        """
+        Positions of a user for the computations reading only the zoom levels and corners : the columns of the
+        image store and the indexes of the positions in the time range, so that the user is not parsed, unless the
+        user is already loaded or there is no store
+        :param pos_id: user id
+        :return: (dictionary of positions or position columns, indexes of the positions to use or None for all)
+        """
+        if self.store is None or self.user_positions.is_loaded(pos_id):
+            return self.user_positions[pos_id], None
+        columns = self.store.positions(pos_id)
+        return columns, np.flatnonzero(time_mask(columns['timestamp'], None, self.end))
+
+    def user_files(self, directory):
+        """
+        :param directory: positions or actions directory
+        :return: list of (user id, file name), in the order of the directory
+        """
+        return [(name.split('_')[0], name) for name in os.listdir(directory)]
+
+    def load_positions(self, pos_id):
+        """
+        Loads the positions of a user
+        :param pos_id: user id
+        :return: dictionary of positions
+        """
+        if self.store is not None:
+            return positions_from_columns(self.store.positions(pos_id), self, calc_gauss=False, end_date=self.end)
+        f = open(self.positions_dir + self.position_files[pos_id], 'rb')
+        csv_in = csv.reader(f)
+        data = list(csv_in)
+        data.pop(0)
+        f.close()
+        return parse_positions(data, self, calc_gauss=False, end_date=self.end)
+
+    def load_actions(self, pos_id):
+        """
+        Loads the annotation actions of a user
+        :param pos_id: user id
+        :return: dictionary of AnnotationActions
+        """
+        if self.store is not None:
+            data = self.store.rows('actions', pos_id)
+        else:
+            f = open(self.annotation_actions_dir + self.action_files[pos_id], 'rb')
+            csv_in = csv.reader(f)
+            data = list(csv_in)
+            data.pop(0)
+            f.close()
+        return parse_annotation_actions(data, self.user_positions[pos_id], self.ref_annotations, end_date=self.end)
 
     def init_user_data_link(self, user_data):
         """
@@ -126,12 +200,12 @@ class Image_data:
 
     def generate_heatmap(self, user_id):
         """
-        Generates a heatmap associated to this image and a user, and keeps it in self
+        Generates a heatmap associated to this image and a user, and keeps it in self.heatmaps
         :param user_id: user to generate heatmap with
         :return: None
         """
         pos = self.user_positions[user_id]
-        pos['heatmap'] = make_heatmap(pos, (self.rescaled_width, self.rescaled_height), self)
+        self.heatmaps[user_id] = make_heatmap(pos, (self.rescaled_width, self.rescaled_height), self)
 
 
     def generate_all_heatmaps(self):
@@ -148,9 +222,7 @@ class Image_data:
         :param user_id: user id of heatmap to be removed
         :return: None
         """
-        pos = self.user_positions[user_id]
-        heatmap = pos['heatmap']
-        pos['heatmap'] = None
+        heatmap = self.heatmaps.pop(user_id, None)
         del heatmap
 
     def remove_all_heatmaps(self):
@@ -180,8 +252,7 @@ class Image_data:
         # determines an average value for all the ln heatmaps
         # determines the highest value found on all the heatmaps
         for u_id in self.user_positions:
-            pos = self.user_positions[u_id]
-            heatmap = np.copy(pos['heatmap'])
+            heatmap = np.copy(self.heatmaps[u_id])
             heatmap = heatmap + 1
             heatmap = np.log10(heatmap)
             tmp = np.max(heatmap)
@@ -199,8 +270,7 @@ class Image_data:
         # Save all heatmaps while taking to account max and avg
         for u_id in self.user_positions:
             out = dir + u_id + "_heatmap.png"
-            pos = self.user_positions[u_id]
-            heatmap = np.copy(pos['heatmap'])
+            heatmap = np.copy(self.heatmaps[u_id])
             heatmap = heatmap + 1
             heatmap = np.log10(heatmap)
             heatmap[0][0] = max_val
@@ -222,8 +292,7 @@ class Image_data:
             os.makedirs(dir)
         for u_id in self.user_positions:
             out = dir + u_id + "_heatmap.png"
-            pos = self.user_positions[u_id]
-            heatmap = np.copy(pos['heatmap'])
+            heatmap = np.copy(self.heatmaps[u_id])
             heatmap = heatmap + 1
             heatmap = np.log10(heatmap)
             save_heatmap(heatmap, (self.rescaled_width, self.rescaled_height), imagefile='converted_image.jpg', savefilename=out, alpha=0.5, annotations=self.ref_annotations)
@@ -243,8 +312,7 @@ class Image_data:
             os.makedirs(dir)
         for u_id in self.user_positions:
             out = dir + u_id + "_heatmap.png"
-            pos = self.user_positions[u_id]
-            heatmap = np.copy(pos['heatmap'])
+            heatmap = np.copy(self.heatmaps[u_id])
             save_heatmap(heatmap, (self.rescaled_width, self.rescaled_height), imagefile='converted_image.jpg', savefilename=out, alpha=0.5, annotations=self.ref_annotations)
             del heatmap
         gc.collect()
@@ -356,9 +424,10 @@ class Image_data:
         """
         max_z = 0
         for u in self.user_positions:
-            tmp = self.user_positions[u]['zoom']
+            pos, rows = self.zoom_positions(u)
+            tmp = pos['zoom'] if rows is None else pos['zoom'][rows]
             if len(tmp) > 0:
-                max_z = max(max_z, np.max(tmp))
+                max_z = max(max_z, int(np.max(tmp)))
         return max_z
 
     def nb_ref_annotations(self):
@@ -0,0 +1,387 @@
+# -*- coding: utf-8 -*-
+
+#
+# * Copyright (c) 2009-2017. Authors: see NOTICE file.
+# *
+# * Licensed under the Apache License, Version 2.0 (the "License");
+# * you may not use this file except in compliance with the License.
+# * You may obtain a copy of the License at
+# *
+# *      http://www.apache.org/licenses/LICENSE-2.0
+# *
+# * Unless required by applicable law or agreed to in writing, software
+# * distributed under the License is distributed on an "AS IS" BASIS,
+# * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# * See the License for the specific language governing permissions and
+# * limitations under the License.
+# */
+
+
+__author__          = "Vanhee Laurent <laurent.vanhee@student.uliege.ac.be>"
+__copyright__       = "Copyright 2010-2017 University of Liège, Belgium, http://www.cytomine.be/"
+
+
+import csv
+import io
+import mmap
+import os
+import shutil
+import string
+import struct
+import sys
+import zipfile
+import numpy as np
+import config
+
+
+# all the user data of an image in one file : images/image_<id>/image_store.npz
+STORE_FILE = "image_store.npz"
+# kind of data -> (directory, suffix of the per user csv files)
+KINDS = {'positions': ("user_positions", "_cytomine_positions.csv"),
+         'annotations': ("user_annotations", "_cytomine_annotations.csv"),
+         'actions': ("user_actions", "_cytomine_actions.csv")}
+POSITION_COLUMNS = ['x', 'y', 'zoom', 'timestamp', 'corners']
+# dtypes of the positions in memory (see dictionary_data.positions_from_columns), used in the store when lossless
+POSITION_DTYPES = {'x': np.int16, 'y': np.int16, 'zoom': np.uint8, 'timestamp': np.int64, 'corners': np.int16}
+# the corners and center literals become numbers separated by spaces
+LITERAL_TABLE = string.maketrans(",", " ")
+LITERAL_DELETE = "[]()"
+
+
+def read_csv_rows(filename):
+    """
+    Reads a csv file without its header
+    :param filename: csv file
+    :return: list of rows
+    """
+    f = open(filename, 'rb')
+    csv_in = csv.reader(f)
+    data = list(csv_in)
+    f.close()
+    data.pop(0)
+    return data
+
+
+def parse_position_columns(data):
+    """
+    Turns the rows of a positions csv file into columns in one pass. The corners and centers are python
+    literals ("[(x, y), ...]" and "(x, y)") : each column is joined in one string, the brackets are removed
+    and the numbers are split on the commas and spaces at once, instead of one literal_eval per row.
+    The downloader writes the coordinates as floats, they are read as floats.
+    :param data: csv rows without header : corners, center, zoom, created
+    :return: dictionary of numpy arrays : x, y (centers), zoom, timestamp and corners (n, 4, 2)
+    """
+    centers = np.fromstring(" ".join(row[1] for row in data).translate(LITERAL_TABLE, LITERAL_DELETE), sep=" ")
+    corners = np.fromstring(" ".join(row[0] for row in data).translate(LITERAL_TABLE, LITERAL_DELETE), sep=" ")
+    timestamps = np.fromstring(" ".join(row[3] for row in data), sep=" ")
+    if len(centers) != 2 * len(data) or len(corners) != 8 * len(data) or len(timestamps) != len(data):
+        raise ValueError("unexpected center, corners or created format")
+    return {'x': centers[0::2],
+            'y': centers[1::2],
+            'zoom': np.array([row[2] for row in data], dtype=np.int64),
+            'timestamp': timestamps,
+            'corners': corners.reshape(-1, 4, 2)}
+
+
+def read_position_csv(filename):
+    """
+    Reads a <user>_cytomine_positions.csv file into columns
+    :param filename: csv file
+    :return: dictionary of numpy arrays (see parse_position_columns)
+    """
+    return parse_position_columns(read_csv_rows(filename))
+
+
+def compact_array(values, dtype):
+    """
+    Converts an array to a smaller dtype, unless some value would change (decimals, out of range)
+    :param values: numpy array
+    :param dtype: smaller dtype
+    :return: converted array, or values as it is
+    """
+    if values.dtype == dtype:
+        return values
+    ret = values.astype(dtype)
+    if np.array_equal(ret, values):
+        return ret
+    return values
+
+
+def rows_to_array(rows):
+    """
+    :param rows: list of csv rows (lists of strings)
+    :return: 2d array of strings, the short rows padded with empty strings
+    """
+    width = max([len(row) for row in rows] + [1])
+    return np.array([row + [""] * (width - len(row)) for row in rows], dtype=str).reshape(len(rows), width)
+
+
+def list_user_files(image_dir, kind):
+    """
+    :param image_dir: image directory
+    :param kind: positions, annotations or actions
+    :return: (user id, file path) of the csv files of this kind, in the order of the directory
+    """
+    directory, suffix = KINDS[kind]
+    path = os.path.join(image_dir, directory)
+    if not os.path.isdir(path):
+        return []
+    return [(name.split('_')[0], os.path.join(path, name)) for name in os.listdir(path) if name.endswith(suffix)]
+
+
+def write_image_store(image_dir, standalone=False):
+    """
+    Packs the positions, annotations and actions of every user of an image in one file. Each kind of data
+    is stored as the rows of all the users concatenated, indexed by the users (in the order of the directory,
+    which is the order Image_data loads them in) and the offset of their first row. The positions are
+    stored by column, the annotations and actions as the csv rows.
+    A standalone store (whose csv files were removed, see convert_project) is merged : its users without a csv
+    file are kept, after the users of the csv files, and the new store is standalone too.
+    :param image_dir: image directory (containing user_positions/, user_annotations/ and user_actions/)
+    :param standalone: optional, marks the store as the only copy of the data (the csv files are about to be removed)
+    :return: number of users with positions in the store
+    """
+    previous = None
+    if is_standalone(image_dir):
+        previous = Image_store(image_dir)
+        standalone = True
+
+    store = {'standalone': np.array(standalone)}
+    for kind in KINDS:
+        users = []
+        parts = []
+        for user_id, filename in list_user_files(image_dir, kind):
+            users.append(user_id)
+            parts.append(read_position_csv(filename) if kind == 'positions' else read_csv_rows(filename))
+        if previous is not None:
+            for user_id in previous.users(kind):
+                if user_id not in users:
+                    users.append(user_id)
+                    parts.append(previous.positions(user_id) if kind == 'positions' else previous.rows(kind, user_id))
+        offsets = np.zeros(len(users) + 1, dtype=np.int64)
+        for i in range(len(users)):
+            offsets[i + 1] = offsets[i] + (len(parts[i]['x']) if kind == 'positions' else len(parts[i]))
+        store[kind + '_users'] = np.array(users, dtype=str)
+        store[kind + '_offsets'] = offsets
+        if kind == 'positions':
+            for c in POSITION_COLUMNS:
+                if len(parts) > 0:
+                    store[c] = compact_array(np.concatenate([part[c] for part in parts]), POSITION_DTYPES[c])
+                else:
+                    store[c] = np.zeros((0, 4, 2) if c == 'corners' else 0, dtype=POSITION_DTYPES[c])
+        else:
+            store[kind] = rows_to_array([row for part in parts for row in part])
+
+    filename = os.path.join(image_dir, STORE_FILE)
+    f = open(filename + ".part", "wb")
+    np.savez(f, **store)
+    f.close()
+    os.rename(filename + ".part", filename)
+    return len(store['positions_users'])
+
+
+def is_standalone(image_dir):
+    """
+    Whether the store of an image is the only copy of its data, its csv files were removed (see convert_project)
+    :param image_dir: image directory
+    :return: boolean
+    """
+    filename = os.path.join(image_dir, STORE_FILE)
+    if not os.path.exists(filename):
+        return False
+    data = np.load(filename)
+    try:
+        return 'standalone' in data.files and bool(data['standalone'])
+    finally:
+        data.close()
+
+
+def newer_csv(image_dir):
+    """
+    :param image_dir: image directory
+    :return: whether some csv files of the image are newer than its store
+    """
+    filename = os.path.join(image_dir, STORE_FILE)
+    if not os.path.exists(filename):
+        return True
+    for directory, suffix in KINDS.values():
+        path = os.path.join(image_dir, directory)
+        if os.path.isdir(path) and os.path.getmtime(path) > os.path.getmtime(filename):
+            return True
+    return False
+
+
+def store_is_current(image_dir):
+    """
+    Whether the store of an image exists and is newer than the csv files left in the image directory (every csv
+    file is written under a temporary name and renamed, which updates its directory). A standalone store is
+    always used : newer csv files (EG from a later download) only hold part of the users, a warning asks to
+    merge them in the store.
+    :param image_dir: image directory
+    :return: boolean
+    """
+    if not os.path.exists(os.path.join(image_dir, STORE_FILE)):
+        return False
+    if not newer_csv(image_dir):
+        return True
+    if is_standalone(image_dir):
+        print "Warning : %s has csv files newer than its store, which is the only copy of the other users. They " \
+              "are not loaded until they are merged in the store (image_store.py <project_name>)" % image_dir
+        return True
+    return False
+
+
+def map_npz(filename):
+    """
+    Maps the arrays of an uncompressed npz file (as written by np.savez) in memory, read only. Every member
+    is a .npy file stored as is in the zip archive : its data starts after the zip local header and the
+    .npy header. The file is mapped once and the arrays are views into that single mapping, which stays open
+    as long as one of them is used : one file descriptor per file (the one the mapping keeps), not per member.
+    :param filename: npz file
+    :return: dictionary name -> array backed by the file
+    """
+    arrays = {}
+    archive = zipfile.ZipFile(filename)
+    f = open(filename, 'rb')
+    try:
+        mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        for info in archive.infolist():
+            if info.compress_type != zipfile.ZIP_STORED:
+                raise ValueError("%s : compressed member %s cannot be mapped" % (filename, info.filename))
+            # zip local header : 30 bytes, then the file name and the extra field
+            f.seek(info.header_offset)
+            name_length, extra_length = struct.unpack('<HH', f.read(30)[26:30])
+            f.seek(info.header_offset + 30 + name_length + extra_length)
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+            name = info.filename[:-len(".npy")]
+            if dtype.hasobject:
+                raise ValueError("%s : object member %s cannot be mapped" % (filename, info.filename))
+            if int(np.prod(shape)) == 0:
+                arrays[name] = np.zeros(shape, dtype=dtype)
+            else:
+                arrays[name] = np.ndarray(shape, dtype=dtype, buffer=mapping, offset=f.tell(),
+                                          order='F' if fortran_order else 'C')
+    finally:
+        f.close()
+        archive.close()
+    return arrays
+
+
+class Image_store:
+    """
+    Content of the store of an image. The data of a user is accessed through the index (users and offsets of
+    each kind), the arrays returned are views into the store.
+    """
+    def __init__(self, image_dir, memory_map=False):
+        """
+        Reads the store
+        :param image_dir: image directory
+        :param memory_map: optional, maps the file in memory instead of reading it : the pages are read when the
+                           arrays are used, and are shared with the other processes mapping the same file
+        """
+        filename = os.path.join(image_dir, STORE_FILE)
+        if memory_map:
+            self.arrays = map_npz(filename)
+        else:
+            # a single sequential read instead of one read per member of the archive
+            f = open(filename, 'rb')
+            data = np.load(io.BytesIO(f.read()))
+            f.close()
+            self.arrays = dict((name, data[name]) for name in data.files)
+            data.close()
+
+        self.order = {}
+        self.index = {}
+        for kind in KINDS:
+            users = [str(user_id) for user_id in self.arrays[kind + '_users']]
+            offsets = self.arrays[kind + '_offsets']
+            self.order[kind] = users
+            self.index[kind] = dict((users[i], (offsets[i], offsets[i + 1])) for i in range(len(users)))
+
+    def users(self, kind):
+        """
+        :param kind: positions, annotations or actions
+        :return: ids of the users with this kind of data, in the order of the directory they come from
+        """
+        return self.order[kind]
+
+    def positions(self, user_id):
+        """
+        :param user_id: user id
+        :return: dictionary of the position columns of the user : x, y, zoom, timestamp, corners (n, 4, 2)
+        """
+        start, end = self.index['positions'][user_id]
+        return dict((c, self.arrays[c][start:end]) for c in POSITION_COLUMNS)
+
+    def rows(self, kind, user_id):
+        """
+        :param kind: annotations or actions
+        :param user_id: user id
+        :return: csv rows of the user (without header), as read from the csv file
+        """
+        start, end = self.index[kind][user_id]
+        return self.arrays[kind][start:end].tolist()
+
+
+def convert_project(project_name, force=False, remove_csv=False):
+    """
+    Writes the store of every image of a downloaded project. The csv files newer than a standalone store (left
+    by a download made after -r) are merged in it.
+    :param project_name: project name (EG "gold")
+    :param force: optional, also rewrites the stores that are up to date
+    :param remove_csv: optional, deletes the per user csv files once they are in the store, which becomes standalone
+    :return: None
+    """
+    images_dir = config.WORKING_DIRECTORY + project_name + "/images/"
+    for image in sorted(os.listdir(images_dir)):
+        image_dir = images_dir + image
+        if image.startswith("image") and os.path.isdir(image_dir):
+            if force or remove_csv or newer_csv(image_dir):
+                nb_users = write_image_store(image_dir, standalone=remove_csv)
+                print "%s : %d users" % (image, nb_users)
+            if remove_csv:
+                for directory, suffix in KINDS.values():
+                    if os.path.isdir(os.path.join(image_dir, directory)):
+                        shutil.rmtree(os.path.join(image_dir, directory))
+
+
+def error_msg():
+    """
+    Output error msg
+    :return:
+    """
+    print "Format : image_store.py <project_name>"
+    print "Packs the csv positions, annotations and actions of a downloaded project in one binary file per image"
+    print "Options :"
+    print "  -f :\n    Rewrites every file, Default only the missing and outdated ones\n"
+    print "  -r :\n    Removes the per user csv files once packed, the store becomes the only copy of the data. The download can then\n    no longer be resumed or synced, the csv files of a later download are merged in the store by running this again\n"
+
+
+def handle_args(args):
+    try:
+        project_name = str(args[1])
+        force = False
+        remove_csv = False
+        for arg in args[2:]:
+            if arg == "-f":
+                force = True
+            elif arg == "-r":
+                remove_csv = True
+            else:
+                raise ValueError(arg)
+    except:
+        error_msg()
+        return
+    if not os.path.exists(config.WORKING_DIRECTORY + project_name):
+        error_msg()
+        return
+    convert_project(project_name, force=force, remove_csv=remove_csv)
+
+
+if __name__ == '__main__':
+
+    handle_args(sys.argv)
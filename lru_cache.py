@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+
+#
+# * Copyright (c) 2009-2017. Authors: see NOTICE file.
+# *
+# * Licensed under the Apache License, Version 2.0 (the "License");
+# * you may not use this file except in compliance with the License.
+# * You may obtain a copy of the License at
+# *
+# *      http://www.apache.org/licenses/LICENSE-2.0
+# *
+# * Unless required by applicable law or agreed to in writing, software
+# * distributed under the License is distributed on an "AS IS" BASIS,
+# * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# * See the License for the specific language governing permissions and
+# * limitations under the License.
+# */
+
+
+__author__          = "Vanhee Laurent <laurent.vanhee@student.uliege.ac.be>"
+__copyright__       = "Copyright 2010-2017 University of Liège, Belgium, http://www.cytomine.be/"
+
+import threading
+from collections import OrderedDict
+
+
+class Lru_cache:
+    """
+    Bounded mapping evicting the least recently used entries, safe to share between threads.
+    """
+    def __init__(self, max_size):
+        """
+        Inits the object
+        :param max_size: maximum number of entries (None for no limit)
+        """
+        self.max_size = max_size
+        self.values = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """
+        Gets an entry and marks it as the most recently used
+        :param key: key of the entry
+        :param default: returned if the key is not in the cache
+        :return: cached value or default
+        """
+        with self.lock:
+            if key not in self.values:
+                self.misses += 1
+                return default
+            value = self.values.pop(key)
+            self.values[key] = value
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        """
+        Adds or replaces an entry, evicts the least recently used ones beyond max_size
+        :param key: key of the entry
+        :param value: value
+        :return: None
+        """
+        with self.lock:
+            self.values.pop(key, None)
+            self.values[key] = value
+            while self.max_size is not None and len(self.values) > self.max_size:
+                self.values.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self.lock:
+            return self.values.pop(key, default)
+
+    def __contains__(self, key):
+        with self.lock:
+            return key in self.values
+
+    def __len__(self):
+        with self.lock:
+            return len(self.values)
+
+    def __str__(self):
+        return "%d entries (max %s), %d hits, %d misses" % (len(self), self.max_size, self.hits, self.misses)
+
+
+# marks the keys missing from a cache
+MISSING = object()
+
+
+class Lazy_mapping:
+    """
+    Read mostly dictionary whose keys are known in advance and whose values are loaded on first access,
+    and kept in a Lru_cache : with a max_size, the least recently used values are dropped and loaded again
+    when needed. The keys keep their order. Values assigned by the caller are never dropped, since they could
+    not be loaded again.
+    """
+    def __init__(self, keys, loader, max_size=None):
+        """
+        Inits the object
+        :param keys: list of keys
+        :param loader: function of a key returning its value
+        :param max_size: optional, maximum number of values kept in memory (None for no limit)
+        """
+        self.key_list = list(keys)
+        self.key_set = set(self.key_list)
+        self.loader = loader
+        self.cache = Lru_cache(max_size)
+        self.assigned = {}
+
+    def __getitem__(self, key):
+        if key not in self.key_set:
+            raise KeyError(key)
+        if key in self.assigned:
+            return self.assigned[key]
+        value = self.cache.get(key, MISSING)
+        if value is MISSING:
+            value = self.loader(key)
+            self.cache.put(key, value)
+        return value
+
+    def __setitem__(self, key, value):
+        if key not in self.key_set:
+            self.key_list.append(key)
+            self.key_set.add(key)
+        self.cache.pop(key)
+        self.assigned[key] = value
+
+    def get(self, key, default=None):
+        if key not in self.key_set:
+            return default
+        return self[key]
+
+    def __contains__(self, key):
+        return key in self.key_set
+
+    def __iter__(self):
+        return iter(list(self.key_list))
+
+    def __len__(self):
+        return len(self.key_list)
+
+    def keys(self):
+        return list(self.key_list)
+
+    def values(self):
+        return [self[key] for key in self.key_list]
+
+    def items(self):
+        return [(key, self[key]) for key in self.key_list]
+
+    def loaded(self):
+        """
+        :return: number of values in memory
+        """
+        return len(self.cache) + len(self.assigned)
+
+    def is_loaded(self, key):
+        """
+        :return: whether the value of key is in memory (accessing it does not call the loader)
+        """
+        return key in self.assigned or key in self.cache
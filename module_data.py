@@ -205,11 +205,12 @@ class Module_data:
                     start, end = self.start_end_indexes(pos)
                     nb_per_image = [0 for j in range(config.MAX_ZOOM)]
                     for i in range(start, end + 1):
-                        tot += pos['zoom'][i]
+                        zoom = int(pos['zoom'][i])
+                        tot += zoom
                         nb += 1
-                        med_list.append(pos['zoom'][i])
-                        tot_per_zoom[pos['zoom'][i] - 1] += 1
-                        nb_per_image[pos['zoom'][i] - 1] += 1
+                        med_list.append(zoom)
+                        tot_per_zoom[zoom - 1] += 1
+                        nb_per_image[zoom - 1] += 1
                     for i in range(config.MAX_ZOOM):
                         med_per_zoom[i].append(nb_per_image[i])
                         avg_per_zoom[i] += nb_per_image[i]
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+
+#
+# * Copyright (c) 2009-2017. Authors: see NOTICE file.
+# *
+# * Licensed under the Apache License, Version 2.0 (the "License");
+# * you may not use this file except in compliance with the License.
+# * You may obtain a copy of the License at
+# *
+# *      http://www.apache.org/licenses/LICENSE-2.0
+# *
+# * Unless required by applicable law or agreed to in writing, software
+# * distributed under the License is distributed on an "AS IS" BASIS,
+# * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# * See the License for the specific language governing permissions and
+# * limitations under the License.
+# */
+
+
+__author__          = "Vanhee Laurent <laurent.vanhee@student.uliege.ac.be>"
+__copyright__       = "Copyright 2010-2017 University of Liège, Belgium, http://www.cytomine.be/"
+
+
+import csv
+import os
+import threading
+
+
+class Property_cache:
+    """
+    Local cache of the annotation properties ('n' key of the reference annotations), kept between runs.
+    An entry is only used while the annotation's 'updated' field is the one it was cached with.
+    """
+    def __init__(self, filename):
+        """
+        Inits the object and loads the cache file if it exists
+        :param filename: cache file (<project>/annotation_properties.csv)
+        """
+        self.filename = filename
+        self.values = {}
+        self.lock = threading.Lock()
+        if os.path.exists(filename):
+            f = open(filename, "rb")
+            csv_in = csv.reader(f)
+            data = list(csv_in)
+            f.close()
+            for row in data[1:]:
+                self.values[row[0]] = (row[1], row[2])
+
+    def get(self, id_annotation, updated):
+        """
+        Gets a cached value
+        :param id_annotation: annotation id
+        :param updated: 'updated' field of the annotation
+        :return: cached value, None if unknown or if the annotation changed since
+        """
+        with self.lock:
+            entry = self.values.get(str(id_annotation))
+        if entry is None or entry[0] != str(updated):
+            return None
+        return entry[1]
+
+    def set(self, id_annotation, updated, value):
+        """
+        Adds or replaces a value
+        :param id_annotation: annotation id
+        :param updated: 'updated' field of the annotation
+        :param value: property value
+        :return: None
+        """
+        with self.lock:
+            self.values[str(id_annotation)] = (str(updated), str(value))
+
+    def save(self):
+        """
+        Writes the cache file
+        :return: None
+        """
+        with self.lock:
+            f = open(self.filename + ".part", "wb")
+            csvout = csv.writer(f)
+            csvout.writerow(['id_annotation', 'updated', 'value'])
+            for id_annotation in self.values:
+                updated, value = self.values[id_annotation]
+                csvout.writerow([id_annotation, updated, value])
+            f.close()
+            os.rename(self.filename + ".part", self.filename)
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+
+#
+# * Copyright (c) 2009-2017. Authors: see NOTICE file.
+# *
+# * Licensed under the Apache License, Version 2.0 (the "License");
+# * you may not use this file except in compliance with the License.
+# * You may obtain a copy of the License at
+# *
+# *      http://www.apache.org/licenses/LICENSE-2.0
+# *
+# * Unless required by applicable law or agreed to in writing, software
+# * distributed under the License is distributed on an "AS IS" BASIS,
+# * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# * See the License for the specific language governing permissions and
+# * limitations under the License.
+# */
+
+
+__author__          = "Vanhee Laurent <laurent.vanhee@student.uliege.ac.be>"
+__copyright__       = "Copyright 2010-2017 University of Liège, Belgium, http://www.cytomine.be/"
+
+
+import threading
+import time
+import config
+
+
+class Rate_limiter:
+    """
+    Client side rate limiting of the requests sent to Cytomine. A token bucket bounds the request rate
+    and a concurrency limit bounds the number of requests in flight. Both limits follow
+    additive-increase/multiplicative-decrease (AIMD) : they grow slowly while the requests are fast and
+    succeed, and are cut down when a request fails or the latency goes above the target.
+    """
+    def __init__(self, max_rate=config.RATE_LIMIT_MAX_RATE, max_concurrency=config.RATE_LIMIT_MAX_CONCURRENCY,
+                 target_latency=config.RATE_LIMIT_TARGET_LATENCY, min_rate=1.0, decrease=0.5, increase=1.0):
+        """
+        Inits the object, starting at half the ceilings
+        :param max_rate: ceiling of the request rate (requests/s)
+        :param max_concurrency: ceiling of the number of requests in flight
+        :param target_latency: latency (s) above which the server is considered overloaded
+        :param min_rate: floor of the request rate (requests/s)
+        :param decrease: multiplicative factor applied to the limits on overload
+        :param increase: added to the concurrency limit (and to the rate, times 10%) after a window of fast requests
+        """
+        self.max_rate = float(max_rate)
+        self.max_concurrency = max_concurrency
+        self.target_latency = target_latency
+        self.min_rate = min_rate
+        self.decrease = decrease
+        self.increase = increase
+
+        self.rate = max(min_rate, self.max_rate / 2)
+        self.concurrency = max(1.0, max_concurrency / 2.0)
+        self.tokens = 1.0
+        self.last_refill = time.time()
+        self.in_flight = 0
+        self.successes = 0
+        self.last_decrease = 0.0
+        self.condition = threading.Condition()
+
+    def acquire(self):
+        """
+        Blocks until a request can be sent (a token is available and the concurrency limit allows it)
+        :return: None
+        """
+        with self.condition:
+            while True:
+                now = time.time()
+                self.tokens = min(max(1.0, self.rate), self.tokens + (now - self.last_refill) * self.rate)
+                self.last_refill = now
+                if self.tokens >= 1.0 and self.in_flight < int(self.concurrency):
+                    self.tokens -= 1.0
+                    self.in_flight += 1
+                    return
+                if self.tokens < 1.0:
+                    self.condition.wait((1.0 - self.tokens) / self.rate)
+                else:
+                    self.condition.wait()
+
+    def release(self, latency, success):
+        """
+        Ends a request started with acquire, and adapts the limits to its outcome
+        :param latency: duration (s) of the request
+        :param success: whether the request succeeded
+        :return: None
+        """
+        with self.condition:
+            self.in_flight -= 1
+            now = time.time()
+            if not success or latency > self.target_latency:
+                # at most one decrease per target latency, requests in flight all see the same overload
+                if now - self.last_decrease > self.target_latency:
+                    self.rate = max(self.min_rate, self.rate * self.decrease)
+                    self.concurrency = max(1.0, self.concurrency * self.decrease)
+                    self.last_decrease = now
+                self.successes = 0
+            else:
+                self.successes += 1
+                if self.successes >= int(self.concurrency):
+                    self.concurrency = min(self.max_concurrency, self.concurrency + self.increase)
+                    self.rate = min(self.max_rate, self.rate + self.increase * max(1.0, 0.1 * self.rate))
+                    self.successes = 0
+            self.condition.notify_all()
+
+    def call(self, func, *args, **kwargs):
+        """
+        Calls func(*args, **kwargs) within the limits
+        :param func: function to call
+        :return: what func returns
+        """
+        self.acquire()
+        start = time.time()
+        success = False
+        try:
+            ret = func(*args, **kwargs)
+            success = True
+            return ret
+        finally:
+            self.release(time.time() - start, success)
+
+    def __str__(self):
+        return "%.1f requests/s, %d in flight max" % (self.rate, int(self.concurrency))
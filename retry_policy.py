@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+
+#
+# * Copyright (c) 2009-2017. Authors: see NOTICE file.
+# *
+# * Licensed under the Apache License, Version 2.0 (the "License");
+# * you may not use this file except in compliance with the License.
+# * You may obtain a copy of the License at
+# *
+# *      http://www.apache.org/licenses/LICENSE-2.0
+# *
+# * Unless required by applicable law or agreed to in writing, software
+# * distributed under the License is distributed on an "AS IS" BASIS,
+# * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# * See the License for the specific language governing permissions and
+# * limitations under the License.
+# */
+
+
+__author__          = "Vanhee Laurent <laurent.vanhee@student.uliege.ac.be>"
+__copyright__       = "Copyright 2010-2017 University of Liège, Belgium, http://www.cytomine.be/"
+
+
+import csv
+import httplib
+import random
+import socket
+import threading
+import time
+from collections import deque
+import config
+
+
+class Retry_exhausted(Exception):
+    """
+    Raised when a call still fails after its whole retry budget
+    """
+    def __init__(self, endpoint, attempts, error):
+        Exception.__init__(self, "%s failed after %d attempts : %r" % (endpoint, attempts, error))
+        self.endpoint = endpoint
+        self.attempts = attempts
+        self.error = error
+
+
+class Call_rejected(Retry_exhausted):
+    """
+    Raised at the first attempt of a call answered with a permanent HTTP error (EG 404, 403), which would
+    fail the same way if retried
+    """
+    def __init__(self, endpoint, status, error):
+        Exception.__init__(self, "%s rejected with HTTP %d : %r" % (endpoint, status, error))
+        self.endpoint = endpoint
+        self.attempts = 1
+        self.status = status
+        self.error = error
+
+
+def http_status(error):
+    """
+    HTTP status of an error raised by a call, if it carries one (status of the Cytomine client responses,
+    code of urllib2 errors)
+    :param error: exception
+    :return: int status, None if the error is not an HTTP error
+    """
+    for holder in [error, getattr(error, 'response', None), getattr(error, 'resp', None)]:
+        for name in ['status', 'status_code', 'code']:
+            status = getattr(holder, name, None)
+            if isinstance(status, (int, long)) and 100 <= status < 600:
+                return int(status)
+    return None
+
+
+def is_transient(error):
+    """
+    Whether a failed call is worth retrying : server errors (5xx), throttling (429), network errors, timeouts
+    and ValueError (raised by the Cytomine client on an html or truncated body). Other HTTP errors (EG 404, 403)
+    and programming errors fail the same way every time.
+    :param error: exception
+    :return: boolean
+    """
+    status = http_status(error)
+    if status is not None:
+        return status >= 500 or status == 429
+    return isinstance(error, (EnvironmentError, socket.timeout, httplib.HTTPException, ValueError))
+
+
+class Retry_policy:
+    """
+    Retry layer shared by all the download workers. Every call gets a bounded number of attempts
+    separated by a jittered exponential backoff. A circuit breaker watches the outcome of the last calls
+    and pauses every worker when the error rate gets too high (the server is most likely overloaded).
+    """
+    def __init__(self, max_attempts=config.RETRY_MAX_ATTEMPTS, base_delay=config.RETRY_BASE_DELAY,
+                 max_delay=config.RETRY_MAX_DELAY, breaker_window=config.BREAKER_WINDOW,
+                 breaker_error_rate=config.BREAKER_ERROR_RATE, breaker_pause=config.BREAKER_PAUSE, telemetry=None,
+                 limiter=None):
+        """
+        Inits the object
+        :param max_attempts: number of attempts for a single call before giving up
+        :param base_delay: delay (s) before the first retry, doubled at each following retry
+        :param max_delay: upper bound (s) of the delay between 2 attempts
+        :param breaker_window: number of recent calls used to compute the error rate
+        :param breaker_error_rate: error rate [0-1] over the window that opens the circuit breaker
+        :param breaker_pause: time (s) during which all the calls are paused once the breaker is open
+        :param telemetry: optional, Download_telemetry object recording every attempt
+        :param limiter: optional, Rate_limiter object every attempt goes through
+        """
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.breaker_error_rate = breaker_error_rate
+        self.breaker_pause = breaker_pause
+        self.outcomes = deque(maxlen=breaker_window)
+        self.paused_until = 0.0
+        self.failures = []
+        self.telemetry = telemetry
+        self.limiter = limiter
+        self.lock = threading.Lock()
+
+    def call(self, endpoint, func, *args, **kwargs):
+        """
+        Calls func(*args, **kwargs), retrying on transient errors (see is_transient). Permanent HTTP errors
+        raise Call_rejected at once, other errors (EG programming errors) are raised as they are. Neither
+        count in the circuit breaker.
+        :param endpoint: name of the called endpoint (used in errors and failure records)
+        :param func: function to call
+        :return: what func returns
+        """
+        error = None
+        for attempt in range(self.max_attempts):
+            self.wait_breaker()
+            if attempt > 0 and self.telemetry is not None:
+                self.telemetry.record_retry(endpoint)
+            if self.limiter is not None:
+                self.limiter.acquire()
+            start = time.time()
+            try:
+                ret = func(*args, **kwargs)
+            except Exception as e:
+                if not is_transient(e):
+                    # says nothing about the load of the server
+                    if self.limiter is not None:
+                        self.limiter.release(time.time() - start, True)
+                    if self.telemetry is not None:
+                        self.telemetry.record_call(endpoint, time.time() - start, False)
+                    status = http_status(e)
+                    if status is not None:
+                        raise Call_rejected(endpoint, status, e)
+                    raise
+                error = e
+                if self.limiter is not None:
+                    self.limiter.release(time.time() - start, False)
+                self.add_outcome(False)
+                if self.telemetry is not None:
+                    self.telemetry.record_call(endpoint, time.time() - start, False)
+                if attempt + 1 < self.max_attempts:
+                    time.sleep(self.backoff(attempt))
+                continue
+            if self.limiter is not None:
+                self.limiter.release(time.time() - start, True)
+            self.add_outcome(True)
+            if self.telemetry is not None:
+                self.telemetry.record_call(endpoint, time.time() - start, True)
+            return ret
+        raise Retry_exhausted(endpoint, self.max_attempts, error)
+
+    def backoff(self, attempt):
+        """
+        "Full jitter" exponential backoff, random delay between 0 and base_delay * 2^attempt
+        :param attempt: index of the failed attempt (0 for the first one)
+        :return: delay in seconds
+        """
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def wait_breaker(self):
+        """
+        Blocks the calling worker while the circuit breaker is open
+        :return: None
+        """
+        while True:
+            with self.lock:
+                delay = self.paused_until - time.time()
+            if delay <= 0:
+                return
+            time.sleep(delay)
+
+    def add_outcome(self, success):
+        """
+        Keeps track of a call outcome, and opens the circuit breaker if the error rate spikes
+        :param success: whether the call succeeded
+        :return: None
+        """
+        with self.lock:
+            self.outcomes.append(success)
+            if len(self.outcomes) < self.outcomes.maxlen:
+                return
+            error_rate = self.outcomes.count(False) / float(len(self.outcomes))
+            if error_rate >= self.breaker_error_rate:
+                print "Error rate of %d%%, pausing all downloads for %ds" % (100 * error_rate, self.breaker_pause)
+                self.paused_until = time.time() + self.breaker_pause
+                self.outcomes.clear()
+
+    def add_failure(self, id_image, id_user, error, endpoint=None):
+        """
+        Records a unit of work that was given up on
+        :param id_image: image id
+        :param id_user: user id (None for image level calls)
+        :param error: Retry_exhausted exception, or any other exception raised while handling the unit
+        :param endpoint: optional, what failed for the other exceptions (EG the name of a download stage)
+        :return: None
+        """
+        if isinstance(error, Retry_exhausted):
+            row = [id_image, id_user, error.endpoint, error.attempts, repr(error.error)]
+        else:
+            row = [id_image, id_user, endpoint, 0, repr(error)]
+        with self.lock:
+            self.failures.append(row)
+        print "Giving up on image %s, user %s : %s" % (id_image, id_user, error)
+
+    def write_failures(self, filename):
+        """
+        Saves the failure records in a csv file
+        :param filename: output file
+        :return: None
+        """
+        f = open(filename, "wb")
+        csvout = csv.writer(f)
+        csvout.writerow(['id_image', 'id_user', 'endpoint', 'attempts', 'error'])
+        with self.lock:
+            for row in self.failures:
+                csvout.writerow(row)
+        f.close()
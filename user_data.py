@@ -30,6 +30,51 @@ from pygazeanalyser.gazeplotter import save_heatmap
 import gc
 import datetime
 
+class User_positions:
+    """
+    Positions of a user in the images the user visited, read like a dictionary image id -> positions. Only
+    the images are kept : the positions are taken from their user_positions on access, so they are not parsed
+    before they are needed and the images can drop them (see Image_data max_users).
+    """
+    def __init__(self, image_data_list, user_id):
+        """
+        Inits the object
+        :param image_data_list: list containing image_data objects
+        :param user_id: user cytomine id
+        """
+        self.user_id = str(user_id)
+        self.images = {}
+        for image in image_data_list:
+            if self.user_id in image.user_positions:
+                self.images[str(image.image_id)] = image
+
+    def __getitem__(self, im_id):
+        return self.images[im_id].user_positions[self.user_id]
+
+    def get(self, im_id, default=None):
+        if im_id not in self.images:
+            return default
+        return self[im_id]
+
+    def __contains__(self, im_id):
+        return im_id in self.images
+
+    def __iter__(self):
+        return iter(self.images)
+
+    def __len__(self):
+        return len(self.images)
+
+    def keys(self):
+        return self.images.keys()
+
+    def values(self):
+        return [self[im_id] for im_id in self.images]
+
+    def items(self):
+        return [(im_id, self[im_id]) for im_id in self.images]
+
+
 class User_data:
     """
     Class containing data on a user
@@ -46,7 +91,7 @@ class User_data:
         :param l_name: last name
         :param email: email address
         """
-        self.positions = {}
+        self.positions = User_positions(image_data_list, user_id)
         self.time_on_img = {}
         self.user_id = user_id
         self.manager = manager
@@ -55,13 +100,6 @@ class User_data:
         self.m_vars = m_vars
         self.x_vars = x_vars
 
-        # fill positions dict
-        for image in image_data_list:
-            if image.user_positions.get(str(user_id)) is not None:
-                pos = image.user_positions[str(user_id)]
-                im_id = image.image_id
-                self.positions[str(im_id)] = pos
-
 
     def nb_ims_visited(self):
         """
@@ -200,7 +238,7 @@ class User_data:
             p = self.positions[im_id]
             zooms = p['zoom']
             for i in range(len(zooms)):
-                ret[zooms[i] - 1] += 1
+                ret[int(zooms[i]) - 1] += 1
         return ret
 
 
@@ -231,7 +269,7 @@ class User_data:
             z = p['zoom']
             vals = np.zeros(config.MAX_ZOOM)
             for i in range(len(z)):
-                vals[np.int(z[i] - 1)] += 1
+                vals[np.int(z[i]) - 1] += 1
             for i in range(config.MAX_ZOOM):
                 zooms[i].append(vals[i])
         # sort each list and select middle
@@ -253,7 +291,7 @@ class User_data:
             p = self.positions[im_id]
             zooms = p['zoom']
             for i in range(len(zooms)):
-                ret += zooms[i]
+                ret += int(zooms[i])
                 total += 1
         if total == 0:
             return 0
@@ -271,7 +309,7 @@ class User_data:
             p = self.positions[im_id]
             zooms = p['zoom']
             for i in range(len(zooms)):
-                ret.append(zooms[i])
+                ret.append(int(zooms[i]))
                 total += 1
 
         ret.sort()
@@ -304,8 +342,7 @@ class User_data:
         # determines an average value for all the ln heatmaps
         # determines the highest value found on all the heatmaps
         for im_id in self.image_data:
-            pos = self.image_data[im_id].user_positions[self.user_id]
-            heatmap = np.copy(pos['heatmap'])
+            heatmap = np.copy(self.image_data[im_id].heatmaps[self.user_id])
             heatmap = heatmap + 1
             heatmap = np.log(heatmap)
             tmp = np.max(heatmap)
@@ -325,8 +362,7 @@ class User_data:
             rgb_im.save('converted_image.jpg')
 
             out = dir + im_id + "_heatmap.png"
-            pos = self.image_data[im_id].user_positions[self.user_id]
-            heatmap = np.copy(pos['heatmap'])
+            heatmap = np.copy(self.image_data[im_id].heatmaps[self.user_id])
             heatmap = heatmap + 1
             heatmap = np.log(heatmap)
             heatmap[0][0] = max_val